@@ -0,0 +1,60 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from util import WordVectorIndex, evaluate_analogy
+
+#
+# 類推問題 (a:b = c:?) をまとめて解く速さ
+# Google の analogy データセットと同じ規模 (14種類の関係, 19544問) の問題を，
+# 関係をベクトルの差として埋め込んだランダムな単語ベクトルで作って解く
+# 1問ずつ解く実装 (行列積1回 + argsort + Pythonで a, b, c を飛ばす) と WordVectorIndex.analogies を比べる
+#
+
+def make_vectors(rng, n_base=700, n_relations=14, dim=100, noise=1.0):
+    base = rng.standard_normal((n_base, dim))
+    offsets = rng.standard_normal((n_relations, dim))
+    words = ['w{}'.format(i) for i in range(n_base)]
+    vecs = [base]
+    for r in range(n_relations):
+        words += ['w{}_r{}'.format(i, r) for i in range(n_base)]
+        vecs.append(base + offsets[r] + noise * rng.standard_normal((n_base, dim)))
+    word2id = {w: i for i, w in enumerate(words)}
+    id2word = {i: w for i, w in enumerate(words)}
+    return np.concatenate(vecs).astype(np.float32), word2id, id2word
+
+
+def make_questions(rng, n, n_base=700, n_relations=14):
+    i, j, r = rng.integers(0, n_base, n), rng.integers(0, n_base, n), rng.integers(0, n_relations, n)
+    return [('w{}'.format(a), 'w{}_r{}'.format(a, k), 'w{}'.format(b), 'w{}_r{}'.format(b, k))
+            for a, b, k in zip(i, j, r) if a != b]
+
+
+def analogy_loop(a, b, c, word2id, id2word, word_matrix):
+    # 1問ずつ解く (本の analogy と同じ方法)
+    query = word_matrix[word2id[b]] - word_matrix[word2id[a]] + word_matrix[word2id[c]]
+    query /= np.sqrt(np.sum(query ** 2))
+    similarity = word_matrix @ query
+    for i in (-1 * similarity).argsort():
+        if id2word[i] not in (a, b, c):
+            return id2word[i]
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    word_vecs, word2id, id2word = make_vectors(rng)
+    questions = make_questions(rng, 19544)
+    print('vocab {}, questions {}'.format(len(word2id), len(questions)))
+
+    normed = word_vecs / np.linalg.norm(word_vecs, axis=1, keepdims=True)
+    start = time.perf_counter()
+    answers = [analogy_loop(a, b, c, word2id, id2word, normed) for a, b, c, _ in questions[:1000]]
+    elapsed = time.perf_counter() - start
+    accuracy = np.mean([x == q[3] for x, q in zip(answers, questions)])
+    print('one by one (1000 questions)  accuracy {:.3f}  {:8.0f} queries/s'.format(accuracy, 1000 / elapsed))
+
+    for chunk_size in (256, 1024, 4096):
+        index = WordVectorIndex(word_vecs, word2id, id2word, chunk_size=chunk_size)
+        accuracy, qps = evaluate_analogy(index, questions)
+        print('batched, chunk {:4d}          accuracy {:.3f}  {:8.0f} queries/s'.format(chunk_size, accuracy, qps))
@@ -0,0 +1,58 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from util import create_co_matrix
+from common import load_corpus
+
+#
+# 共起行列の作成時間
+# 2.ipynb の二重ループ版と，util.create_co_matrix (ずらした配列でまとめて数える) の比較
+# PTBがダウンロードできないときは，同じ語彙数・同じ長さのZipf分布のコーパスで代用する (common.load_corpus)
+#
+
+def create_co_matrix_loop(corpus, vocab_size, window_size=1):
+    # 2.ipynb の実装 (ウィンドウ内の距離 i を使うように直したもの)
+    corpus_size = len(corpus)
+    co_matrix = np.zeros((vocab_size, vocab_size), dtype=np.int32)
+    for idx, word_id in enumerate(corpus):
+        for i in range(1, window_size + 1):
+            left_idx = idx - i
+            right_idx = idx + i
+            if left_idx >= 0:
+                co_matrix[word_id, corpus[left_idx]] += 1
+            if right_idx < corpus_size:
+                co_matrix[word_id, corpus[right_idx]] += 1
+    return co_matrix
+
+
+def timeit(f):
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    corpus, word2id, _ = load_corpus()
+    V = len(word2id)
+    window_size = 2
+    print('corpus {} tokens, vocab {}, window {}'.format(len(corpus), V, window_size))
+
+    t_loop, C_loop = timeit(lambda: create_co_matrix_loop(corpus, V, window_size))
+    print('loop (2.ipynb)         {:7.2f} s  {:6.0f} MiB'.format(t_loop, C_loop.nbytes / 2 ** 20))
+
+    t, C = timeit(lambda: create_co_matrix(corpus, V, window_size, sparse_output=False))
+    print('np.add.at (dense)      {:7.2f} s  {:6.0f} MiB  equal {}'.format(
+        t, C.nbytes / 2 ** 20, np.array_equal(C, C_loop)))
+    del C
+
+    t, C = timeit(lambda: create_co_matrix(corpus, V, window_size))
+    nbytes = C.data.nbytes + C.indices.nbytes + C.indptr.nbytes
+    print('sparse CSR             {:7.2f} s  {:6.0f} MiB  equal {}  nnz {}'.format(
+        t, nbytes / 2 ** 20, np.array_equal(C.toarray(), C_loop), C.nnz))
+
+    t, C = timeit(lambda: create_co_matrix(corpus, V, window_size, chunk_size=100000))
+    print('sparse CSR, chunk 1e5  {:7.2f} s'.format(t))
+    t, C = timeit(lambda: create_co_matrix(corpus, V, window_size, weighting='harmonic'))
+    print('sparse CSR, 1/d weight {:7.2f} s'.format(t))
@@ -0,0 +1,62 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import tracemalloc
+import numpy as np
+from util import create_co_matrix, ppmi
+from common import load_corpus
+
+#
+# PPMIの計算時間とピークメモリ (PTBの共起行列, window 2)
+# 2.ipynb の二重ループ版は全体(1億セル)だと時間がかかりすぎるので，先頭の行だけ測って全体に換算する
+# PTBがダウンロードできないときは，同じ語彙数・同じ長さのZipf分布のコーパスで代用する (common.load_corpus)
+#
+
+def ppmi_loop(C, rows, eps=1e-7):
+    # 2.ipynb の実装 (先頭 rows 行だけ)
+    M = np.zeros((rows, C.shape[1]), dtype=np.float32)
+    N = np.sum(C)
+    S = np.sum(C, axis=0)
+    for i in range(rows):
+        for j in range(C.shape[1]):
+            pmi = np.log2(C[i, j] * N / (S[i] * S[j] + eps))
+            M[i, j] = max(0, pmi)
+    return M
+
+
+def measure(f):
+    # 戻り値の大きさも含めたピークメモリ (tracemalloc は NumPy の確保も数える)
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = f()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20, result
+
+
+if __name__ == '__main__':
+    corpus, word2id, _ = load_corpus()
+    V = len(word2id)
+    C_sparse = create_co_matrix(corpus, V, window_size=2)
+    C = C_sparse.toarray()
+
+    rows = 20
+    start = time.perf_counter()
+    with np.errstate(divide='ignore'):
+        M_loop = ppmi_loop(C, rows)
+    t = time.perf_counter() - start
+    print('loop (2.ipynb)        {:8.2f} s (estimated from {} rows)'.format(t * V / rows, rows))
+
+    t, peak, M = measure(lambda: ppmi(C))
+    print('dense, row blocks     {:8.2f} s  peak {:6.0f} MiB  max diff {:.1e}'.format(
+        t, peak, np.abs(M[:rows] - M_loop).max()))
+    del M
+
+    t, peak, M = measure(lambda: ppmi(C_sparse))
+    print('sparse nonzeros       {:8.2f} s  peak {:6.0f} MiB  nnz {}'.format(t, peak, M.nnz))
+    t, peak, M = measure(lambda: ppmi(C_sparse, alpha=0.75, k=5))
+    print('sparse, alpha .75 k 5 {:8.2f} s  peak {:6.0f} MiB  nnz {}'.format(t, peak, M.nnz))
+    t, _, M = measure(lambda: ppmi(C_sparse, processes=2))
+    print('sparse, 2 processes   {:8.2f} s  (cpus: {})'.format(t, os.cpu_count()))
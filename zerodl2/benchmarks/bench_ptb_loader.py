@@ -0,0 +1,77 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+import ptb
+from common import zipf_corpus
+
+#
+# PTBの読み込み時間とメモリ
+# 以前の形式 (int64 の .npy を全部読む + 語彙は pickle の dict) と
+# 新しい形式 (uint16 の .npy を mmap で開く + 語彙は StringTable) を比べる
+# 4プロセスで同時に読み込み，コーパス全体と語彙1000語を引いたあとの RSS と PSS (共有ページを等分したもの) を測る
+# (PTBがダウンロードできないので，同じ長さのZipf分布のコーパスを一時ディレクトリに書いて使う)
+#
+
+CHILD = '''
+import sys, time, pickle
+import numpy as np
+sys.path.insert(0, {root!r})
+import ptb
+ptb.dataset_dir = {data_dir!r}
+start = time.perf_counter()
+if {old}:
+    with open({data_dir!r} + '/ptb.vocab.pkl', 'rb') as f:
+        word_to_id, id_to_word = pickle.load(f)
+    corpus = np.load({data_dir!r} + '/ptb.train.old.npy')
+else:
+    corpus, word_to_id, id_to_word = ptb.load_data('train')
+elapsed = time.perf_counter() - start
+total = int(corpus.sum())
+ids = [word_to_id[id_to_word[i]] for i in range(1000)]
+print('ready', flush=True)
+sys.stdin.readline()
+mem = {{}}
+for line in open('/proc/self/smaps_rollup'):
+    key, value = line.split(':', 1)
+    if key in ('Rss', 'Pss'):
+        mem[key] = int(value.split()[0]) / 1024
+print(elapsed, mem['Rss'], mem['Pss'], flush=True)
+'''
+
+
+def run(data_dir, old, n_procs=4):
+    code = CHILD.format(root=os.path.dirname(ptb.__file__), data_dir=data_dir, old=old)
+    procs = [subprocess.Popen([sys.executable, '-c', code], stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE, text=True) for _ in range(n_procs)]
+    for p in procs:
+        p.stdout.readline()
+    for p in procs:
+        p.stdin.write('\n')
+        p.stdin.flush()
+    results = np.array([[float(v) for v in p.stdout.readline().split()] for p in procs])
+    for p in procs:
+        p.wait()
+    return results.mean(axis=0)
+
+
+if __name__ == '__main__':
+    word_to_id, id_to_word = ptb.load_vocab()
+    corpus = zipf_corpus(len(word_to_id))
+
+    with tempfile.TemporaryDirectory() as d:
+        shutil.copy(os.path.join(ptb.dataset_dir, ptb.vocab_file), d)
+        np.save(os.path.join(d, 'ptb.train.old.npy'), corpus)
+        np.save(os.path.join(d, 'ptb.train.npy'), corpus.astype(ptb.id_dtype(len(word_to_id))))
+        ptb.dataset_dir = d
+        ptb.load_vocab_table()
+
+        for name in ('ptb.train.old.npy', 'ptb.train.npy'):
+            print('{:20s} {:6.2f} MiB'.format(name, os.path.getsize(os.path.join(d, name)) / 2 ** 20))
+        for label, old in (('int64 + pickle', True), ('uint16 mmap + table', False)):
+            elapsed, rss, pss = run(d, old)
+            print('{:20s} load {:7.2f} ms  RSS {:6.1f} MiB  PSS {:6.1f} MiB (per process, 4 processes)'.format(
+                label, elapsed * 1e3, rss, pss))
@@ -0,0 +1,83 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from scipy.sparse.linalg import svds
+from util import create_co_matrix, ppmi, WordVectorIndex
+from common import load_corpus
+
+#
+# 類似単語検索の速さ
+# 1. PTB の PPMI を SVD で100次元にしたベクトルで，2.ipynb の most_similar と WordVectorIndex を比べる
+#    (randomized_svd の代わりに scipy の svds を使う．PTBがないときはZipf分布のコーパスで代用)
+# 2. 100万語の語彙 (クラスタ構造を持たせたランダムなベクトル) で exact と ivf を比べる
+#
+
+def cos_similarity(x, y, eps=1e-8):
+    nx = x / np.sqrt(np.sum(x ** 2) + eps)
+    ny = y / np.sqrt(np.sum(y ** 2) + eps)
+    return nx @ ny
+
+
+def most_similar_loop(query, word2id, id2word, word_matrix, top=5):
+    # 2.ipynb の most_similar (print せずに結果を返すようにしたもの)
+    query_id = word2id[query]
+    query_vec = word_matrix[query_id]
+    vocab_size = len(word2id)
+    similarity = np.zeros(vocab_size)
+    for i in range(vocab_size):
+        similarity[i] = cos_similarity(word_matrix[i], query_vec)
+    result = []
+    for i in (-1 * similarity).argsort():
+        if id2word[i] == query:
+            continue
+        result.append(i)
+        if len(result) >= top:
+            return result
+
+
+def recall(ids, exact_ids):
+    return np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(ids, exact_ids)])
+
+
+def timeit(f):
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    corpus, word2id, id2word = load_corpus()
+    W = ppmi(create_co_matrix(corpus, len(word2id), window_size=2))
+    U, S, V = svds(W, k=100, random_state=0)
+    word_vecs = U.astype(np.float32)
+    words = list(word2id)[:1000]
+    ids = np.array([word2id[w] for w in words])
+    top = 5
+
+    t, _ = timeit(lambda: [most_similar_loop(w, word2id, id2word, word_vecs, top) for w in words[:20]])
+    print('PTB, loop (2.ipynb)     {:10.1f} queries/s'.format(20 / t))
+    index = WordVectorIndex(word_vecs, word2id, id2word)
+    t, _ = timeit(lambda: [index.most_similar(w, top) for w in words])
+    print('PTB, exact, one by one  {:10.1f} queries/s'.format(len(words) / t))
+    t, (exact_ids, _) = timeit(lambda: index.search(word_vecs[ids], top, exclude=ids))
+    print('PTB, exact, batched     {:10.1f} queries/s'.format(len(words) / t))
+    t_build, ivf = timeit(lambda: WordVectorIndex(word_vecs, word2id, id2word, mode='ivf'))
+    t, (ivf_ids, _) = timeit(lambda: ivf.search(word_vecs[ids], top, exclude=ids))
+    print('PTB, ivf, batched       {:10.1f} queries/s  recall@{} {:.3f}  (build {:.1f} s)'.format(
+        len(words) / t, top, recall(ivf_ids, exact_ids), t_build))
+
+    rng = np.random.default_rng(0)
+    n, dim = 1000000, 100
+    centers = rng.standard_normal((2000, dim)).astype(np.float32)
+    big = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    queries = rng.integers(0, n, 1000)
+    t_build, index = timeit(lambda: WordVectorIndex(big, {}, {}))
+    t, (exact_ids, _) = timeit(lambda: index.search(big[queries], top, exclude=queries))
+    print('1M words, exact         {:10.1f} queries/s'.format(len(queries) / t))
+    del index
+    t_build, ivf = timeit(lambda: WordVectorIndex(big, {}, {}, mode='ivf'))
+    t, (ivf_ids, _) = timeit(lambda: ivf.search(big[queries], top, exclude=queries))
+    print('1M words, ivf           {:10.1f} queries/s  recall@{} {:.3f}  (build {:.1f} s)'.format(
+        len(queries) / t, top, recall(ivf_ids, exact_ids), t_build))
@@ -0,0 +1,27 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import urllib.error
+import numpy as np
+import ptb
+
+#
+# ベンチマークで共通に使うコーパス
+# PTBがダウンロードできないときは，同じ語彙数・同じ長さのZipf分布のコーパスで代用する
+#
+
+def zipf_corpus(vocab_size, size=929589, seed=0):
+    # 頻度が順位に反比例するコーパス (PTBの訓練データと同じ長さ)
+    rng = np.random.default_rng(seed)
+    p = 1.0 / np.arange(1, vocab_size + 1)
+    return rng.choice(vocab_size, size=size, p=p / p.sum())
+
+
+def load_corpus():
+    try:
+        corpus, word2id, id2word = ptb.load_data('train')
+    except urllib.error.URLError:
+        word2id, id2word = ptb.load_vocab()
+        corpus = zipf_corpus(len(word2id))
+        print('(PTB is not available, using a synthetic Zipf corpus)')
+    return corpus, word2id, id2word
@@ -7,6 +7,9 @@ try:
 except ImportError:
     raise ImportError('Use Python3!')
 import pickle
+import uuid
+import zlib
+from collections.abc import Mapping
 import numpy as np
 
 
@@ -22,6 +25,7 @@ save_file = {
     'valid':'ptb.valid.npy'
 }
 vocab_file = 'ptb.vocab.pkl'
+vocab_table_file = 'ptb.vocab.{}.npy'
 
 dataset_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -73,6 +77,142 @@ def load_vocab():
     return word_to_id, id_to_word
 
 
+class StringTable:
+    '''
+    単語の列を1本のバイト列 (UTF-8) と各単語の開始位置の配列で持つ
+    単語→IDは CRC32 をキーにしたオープンアドレス法のハッシュ表 (これも配列) で引く
+    どれも .npy で保存して mmap_mode='r' で開くので，読み込みは一瞬で複数プロセスで共有される
+    '''
+    EMPTY = np.uint32(0xFFFFFFFF)
+
+    def __init__(self, strings, offsets, index):
+        self.strings = strings
+        self.offsets = offsets
+        self.index = index
+
+    @classmethod
+    def build(cls, words):
+        encoded = [w.encode('utf-8') for w in words]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        strings = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+        # 表の大きさは単語数の2倍以上の2のべき乗
+        index = np.full(1 << max(1, 2 * len(encoded) - 1).bit_length(), cls.EMPTY, dtype=np.uint32)
+        mask = len(index) - 1
+        for i, b in enumerate(encoded):
+            h = zlib.crc32(b) & mask
+            while index[h] != cls.EMPTY:
+                h = (h + 1) & mask
+            index[h] = i
+        return cls(strings, offsets, index)
+
+    def save(self, path_format):
+        for name in ('strings', 'offsets', 'index'):
+            _save_npy(path_format.format(name), getattr(self, name))
+
+    @classmethod
+    def load(cls, path_format):
+        return cls(*[np.load(path_format.format(name), mmap_mode='r')
+                     for name in ('strings', 'offsets', 'index')])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def word(self, i):
+        return self.strings[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def find(self, word):
+        # 見つからなければ -1
+        b = word.encode('utf-8')
+        mask = len(self.index) - 1
+        h = zlib.crc32(b) & mask
+        while True:
+            i = self.index[h]
+            if i == self.EMPTY:
+                return -1
+            if self.strings[self.offsets[i]:self.offsets[i + 1]].tobytes() == b:
+                return int(i)
+            h = (h + 1) & mask
+
+
+class WordToId(Mapping):
+    '''
+    StringTable を word_to_id (dict) と同じように使えるようにする
+    '''
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, word):
+        i = self.table.find(word) if isinstance(word, str) else -1
+        if i < 0:
+            raise KeyError(word)
+        return i
+
+    def __iter__(self):
+        return (self.table.word(i) for i in range(len(self.table)))
+
+    def __len__(self):
+        return len(self.table)
+
+
+class IdToWord(Mapping):
+    '''
+    StringTable を id_to_word (dict) と同じように使えるようにする
+    '''
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, i):
+        if not isinstance(i, (int, np.integer)) or not 0 <= i < len(self.table):
+            raise KeyError(i)
+        return self.table.word(i)
+
+    def __iter__(self):
+        return iter(range(len(self.table)))
+
+    def __len__(self):
+        return len(self.table)
+
+
+def load_vocab_table():
+    '''
+        ptb.vocab.pkl の語彙を StringTable にしたもの (初回だけ作って保存する)
+        :return: word_to_id, id_to_word (dict と同じように使える)
+    '''
+    path_format = dataset_dir + '/' + vocab_table_file
+    if not all(os.path.exists(path_format.format(name)) for name in ('strings', 'offsets', 'index')):
+        word_to_id, id_to_word = load_vocab()
+        StringTable.build([id_to_word[i] for i in range(len(id_to_word))]).save(path_format)
+    table = StringTable.load(path_format)
+    return WordToId(table), IdToWord(table)
+
+
+def id_dtype(vocab_size):
+    # 単語IDを入れられる一番小さい符号なし整数型 (PTBの1万語なら uint16)
+    return np.min_scalar_type(max(vocab_size - 1, 0))
+
+
+def _save_npy(save_path, array):
+    # 読み込み中の mmap を壊さないように，別名で書いてから置き換える
+    # 別名は O_EXCL で作るので他のプロセスと重ならない (権限は np.save と同じく umask に従う)
+    flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0)
+    while True:
+        tmp_path = '{}.{}.tmp'.format(save_path, uuid.uuid4().hex)
+        try:
+            fd = os.open(tmp_path, flags, 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, save_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
 def load_data(data_type='train'):
     '''
         :param data_type: データの種類：'train' or 'test' or 'valid (val)'
@@ -81,10 +221,16 @@ def load_data(data_type='train'):
     if data_type == 'val': data_type = 'valid'
     save_path = dataset_dir + '/' + save_file[data_type]
 
-    word_to_id, id_to_word = load_vocab()
+    word_to_id, id_to_word = load_vocab_table()
+    dtype = id_dtype(len(word_to_id))
 
     if os.path.exists(save_path):
-        corpus = np.load(save_path)
+        # コーパスは読み込み専用の mmap (複数の学習プロセスで同じページを共有する)
+        corpus = np.load(save_path, mmap_mode='r')
+        if corpus.dtype != dtype:
+            # 以前の形式 (int64) のキャッシュは詰め直す
+            _save_npy(save_path, np.array(corpus, dtype=dtype))
+            corpus = np.load(save_path, mmap_mode='r')
         return corpus, word_to_id, id_to_word
 
     file_name = key_file[data_type]
@@ -92,10 +238,11 @@ def load_data(data_type='train'):
     _download(file_name)
 
     words = open(file_path).read().replace('\n', '<eos>').strip().split()
-    corpus = np.array([word_to_id[w] for w in words])
+    vocab, _ = load_vocab()  # 変換は dict の方が速い
+    corpus = np.array([vocab[w] for w in words], dtype=dtype)
 
-    np.save(save_path, corpus)
-    return corpus, word_to_id, id_to_word
+    _save_npy(save_path, corpus)
+    return np.load(save_path, mmap_mode='r'), word_to_id, id_to_word
 
 
 if __name__ == '__main__':
@@ -0,0 +1,315 @@
+# coding: utf-8
+import contextlib
+import functools
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy import sparse
+
+
+#
+# 共起行列
+#
+
+def create_co_matrix(corpus, vocab_size, window_size=1, weighting=None,
+                     chunk_size=1000000, sparse_output=True):
+    """
+    共起行列の作成 (2.ipynb の create_co_matrix をループなしで計算する)
+
+    ウィンドウ内の距離 d ごとに，corpus[:-d] と corpus[d:] をずらして並べた配列が
+    そのまま (単語, 右側の単語) のペアになる．左右は対称なので両方向に足す
+
+    weighting: None なら回数，'harmonic' なら 1/d，関数なら weighting(d) を重みにする
+    chunk_size: 一度に処理する位置の数 (ペアを作るための一時メモリを抑える)
+    sparse_output: True なら scipy.sparse の CSR 行列，False なら密な ndarray を返す
+    """
+    corpus = np.asarray(corpus)
+    corpus_size = len(corpus)
+    if weighting is None:
+        dtype = np.int32
+        weight = lambda d: 1
+    else:
+        dtype = np.float32
+        weight = (lambda d: 1.0 / d) if weighting == 'harmonic' else weighting
+
+    if sparse_output:
+        co_matrix = sparse.csr_matrix((vocab_size, vocab_size), dtype=dtype)
+    else:
+        co_matrix = np.zeros((vocab_size, vocab_size), dtype=dtype)
+
+    for d in range(1, window_size + 1):
+        w = weight(d)
+        for start in range(0, corpus_size - d, chunk_size):
+            stop = min(start + chunk_size, corpus_size - d)
+            left = corpus[start:stop].astype(np.int64)
+            right = corpus[start + d:stop + d].astype(np.int64)
+            if sparse_output:
+                # 重複した (行, 列) は CSR への変換で足し合わされる
+                rows = np.concatenate([left, right])
+                cols = np.concatenate([right, left])
+                data = np.full(len(rows), w, dtype=dtype)
+                co_matrix = co_matrix + sparse.coo_matrix(
+                    (data, (rows, cols)), shape=(vocab_size, vocab_size)).tocsr()
+            else:
+                # 重複した (行, 列) があっても np.add.at なら全部足される
+                np.add.at(co_matrix, (left, right), w)
+                np.add.at(co_matrix, (right, left), w)
+    return co_matrix
+
+
+#
+# PPMI (正の相互情報量)
+#
+
+def _ppmi_block(C, row_sums, col_probs, shift, eps):
+    """
+    C の行ブロックに対する PPMI．PMI = log2(C[i,j] / (S[i] * P(j))) (P(j) は文脈の確率)
+    疎行列なら非ゼロ要素だけを計算する (C[i,j] = 0 の PMI は -inf なので PPMI は 0)
+    """
+    if sparse.issparse(C):
+        C = C.tocoo()
+        pmi = np.log2(C.data / (row_sums[C.row] * col_probs[C.col] + eps)) - shift
+        keep = pmi > 0
+        return sparse.csr_matrix((pmi[keep].astype(np.float32), (C.row[keep], C.col[keep])),
+                                 shape=C.shape)
+    with np.errstate(divide='ignore'):
+        pmi = np.log2(C / (row_sums[:, None] * col_probs[None, :] + eps))
+    pmi -= shift
+    return np.maximum(pmi, 0).astype(np.float32)
+
+
+def ppmi(C, verbose=False, eps=1e-7, alpha=1.0, k=1, block_size=1000, processes=None):
+    """
+    PPMI行列の作成 (2.ipynb の ppmi を行ブロックごとにまとめて計算する)
+
+    C: 共起行列 (ndarray または scipy.sparse の行列．疎行列なら疎行列で返す)
+    alpha: 文脈の分布の平滑化 (0.75 にすると出現頻度の低い単語の PMI が大きくなりすぎない)
+    k: shifted PPMI．max(PMI - log2(k), 0) にする
+    block_size: 一度に計算する行数 (一時メモリを抑える)
+    processes: 指定すると行ブロックをプロセスプールで並列に計算する
+    """
+    is_sparse = sparse.issparse(C)
+    if is_sparse:
+        C = C.tocsr()
+    N = C.sum()
+    row_sums = np.asarray(C.sum(axis=1), dtype=np.float64).ravel()
+    col_sums = np.asarray(C.sum(axis=0), dtype=np.float64).ravel()
+    if alpha == 1.0:
+        col_probs = col_sums / N
+    else:
+        col_probs = col_sums ** alpha
+        col_probs /= col_probs.sum()
+    shift = np.log2(k)
+
+    # 2.ipynb は log2(C * N / (S[i] * S[j] + eps)) なので，両辺を N で割った式では eps / N になる
+    run = functools.partial(_ppmi_block, col_probs=col_probs, shift=shift, eps=eps / N)
+    starts = range(0, C.shape[0], block_size)
+    blocks = [C[i:i + block_size] for i in starts]
+    row_blocks = [row_sums[i:i + block_size] for i in starts]
+    M = [] if is_sparse else np.empty(C.shape, dtype=np.float32)
+    with contextlib.ExitStack() as stack:
+        if processes is None:
+            results = map(run, blocks, row_blocks)
+        else:
+            executor = stack.enter_context(ProcessPoolExecutor(processes))
+            results = executor.map(run, blocks, row_blocks)
+        for n, (i, block) in enumerate(zip(starts, results), 1):
+            if is_sparse:
+                M.append(block)
+            else:
+                M[i:i + block_size] = block
+            if verbose:
+                print(f"{100 * n / len(starts):.1f}% done")
+    return sparse.vstack(M, format='csr') if is_sparse else M
+
+
+#
+# 類似単語の検索
+#
+
+def _top_k(S, k):
+    """
+    S の各行で値が大きい順に k 個の (列番号, 値) を返す (argpartition で k 個に絞ってから並べる)
+    """
+    k = min(k, S.shape[1])
+    idx = np.argpartition(S, S.shape[1] - k, axis=1)[:, -k:]
+    vals = np.take_along_axis(S, idx, axis=1)
+    order = np.argsort(-vals, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+
+def _normalize(x, eps=1e-8):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.sqrt(np.sum(x ** 2, axis=-1, keepdims=True) + eps)
+
+
+class WordVectorIndex:
+    """
+    単語ベクトルのコサイン類似度で上位 k 個を探す (2.ipynb の most_similar の置き換え)
+
+    ベクトルは最初に一度だけ正規化しておくので，類似度は行列積1回で求まる
+    mode='ivf' にすると k-means で単語をクラスタに分け，クエリに近い n_probe 個の
+    クラスタの中だけを探す (近似．語彙が100万語程度になるとき用)
+
+    chunk_size: 一度に処理するクエリの数
+    max_elements: 一度に作る類似度行列の要素数の上限 (語彙方向にも分けて計算する)
+    """
+
+    def __init__(self, word_matrix, word2id, id2word, mode='exact', n_lists=None,
+                 n_probe=8, n_iter=10, chunk_size=1024, max_elements=2 ** 22, seed=0):
+        self.word2id = word2id
+        self.id2word = id2word
+        self.vectors = _normalize(word_matrix)
+        self.mode = mode
+        self.n_probe = n_probe
+        self.chunk_size = chunk_size
+        self.max_elements = max_elements
+        if mode == 'ivf':
+            self._build_ivf(n_lists or int(np.sqrt(len(self.vectors))), n_iter, seed)
+        elif mode != 'exact':
+            raise ValueError(f"unknown mode: {mode}")
+
+    def _assign(self, x):
+        return np.concatenate([np.argmax(x[i:i + self.chunk_size] @ self.centroids.T, axis=1)
+                               for i in range(0, len(x), self.chunk_size)])
+
+    def _build_ivf(self, n_lists, n_iter, seed):
+        # 球面 k-means (重心も正規化する)．学習はサンプルだけで行う
+        rng = np.random.default_rng(seed)
+        n = len(self.vectors)
+        sample = self.vectors[rng.choice(n, size=min(n, 64 * n_lists), replace=False)]
+        self.centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(n_iter):
+            labels = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = self.centroids[empty]
+            self.centroids = _normalize(sums)
+
+        # クラスタごとにベクトルを連続して並べておく
+        labels = self._assign(self.vectors)
+        self.order = np.argsort(labels, kind='stable')
+        self.sorted_vectors = self.vectors[self.order]
+        self.offsets = np.searchsorted(labels[self.order], np.arange(n_lists + 1))
+
+    def search(self, queries, top=5, exclude=None):
+        """
+        queries: クエリのベクトル (nq, dim)
+        exclude: 結果から除く単語ID (nq,) または (nq, m)．-1 は無視される
+        戻り値: 単語ID (nq, top) と類似度 (nq, top)．候補が足りないときは ID が -1 (類似度は -inf) になる
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        if exclude is not None:
+            exclude = np.asarray(exclude).reshape(len(queries), -1)
+        ids, sims = [], []
+        for i in range(0, len(queries), self.chunk_size):
+            q = queries[i:i + self.chunk_size]
+            ex = None if exclude is None else exclude[i:i + self.chunk_size]
+            search = self._search_exact if self.mode == 'exact' else self._search_ivf
+            chunk_ids, chunk_sims = search(q, top, ex)
+            ids.append(chunk_ids)
+            sims.append(chunk_sims)
+        return np.concatenate(ids), np.concatenate(sims)
+
+    def _search_exact(self, q, top, exclude):
+        # 語彙をブロックに分け，ブロックごとの上位 top 個から全体の上位 top 個を選ぶ
+        step = max(top, self.max_elements // len(q))
+        cand_ids, cand_sims = [], []
+        for start in range(0, len(self.vectors), step):
+            S = q @ self.vectors[start:start + step].T
+            if exclude is not None:
+                rows, k = np.nonzero((exclude >= start) & (exclude < start + S.shape[1]))
+                S[rows, exclude[rows, k] - start] = -np.inf
+            idx, vals = _top_k(S, top)
+            cand_ids.append(idx + start)
+            cand_sims.append(vals)
+        if len(cand_ids) == 1:
+            ids, sims = cand_ids[0], cand_sims[0]
+        else:
+            idx, sims = _top_k(np.concatenate(cand_sims, axis=1), top)
+            ids = np.take_along_axis(np.concatenate(cand_ids, axis=1), idx, axis=1)
+        # 除いた単語 (-inf) は ivf と同じく -1 にし，語彙が top より少ないときは -1 で埋める
+        ids[np.isneginf(sims)] = -1
+        pad = top - ids.shape[1]
+        if pad > 0:
+            ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+            sims = np.pad(sims, ((0, 0), (0, pad)), constant_values=-np.inf)
+        return ids, sims
+
+    def _search_ivf(self, q, top, exclude):
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes, _ = _top_k(q @ self.centroids.T, n_probe)
+        k = top + (0 if exclude is None else exclude.shape[1])
+        cand_ids = np.full((len(q), n_probe, k), -1)
+        cand_sims = np.full((len(q), n_probe, k), -np.inf, dtype=np.float32)
+        # クラスタごとに，そのクラスタを探すクエリをまとめて1回の行列積にする
+        for l in np.unique(probes):
+            rows, rank = np.nonzero(probes == l)
+            start, end = self.offsets[l], self.offsets[l + 1]
+            if start == end:
+                continue
+            idx, vals = _top_k(q[rows] @ self.sorted_vectors[start:end].T, k)
+            cand_ids[rows, rank, :idx.shape[1]] = self.order[start + idx]
+            cand_sims[rows, rank, :idx.shape[1]] = vals
+
+        cand_ids = cand_ids.reshape(len(q), -1)
+        cand_sims = cand_sims.reshape(len(q), -1)
+        if exclude is not None:
+            masked = (cand_ids[:, :, None] == exclude[:, None, :]) & (exclude[:, None, :] >= 0)
+            cand_sims[masked.any(axis=2)] = -np.inf
+        idx, sims = _top_k(cand_sims, top)
+        ids = np.take_along_axis(cand_ids, idx, axis=1)
+        ids[np.isneginf(sims)] = -1
+        return ids, sims
+
+    def most_similar(self, query, top=5):
+        """
+        単語 query に近い単語を (単語, 類似度) のリストで返す (query 自身は除く)
+        """
+        if query not in self.word2id:
+            print(f"{query} is not found")
+            return []
+        query_id = self.word2id[query]
+        ids, sims = self.search(self.vectors[query_id], top, exclude=[query_id])
+        return [(self.id2word[i], float(s)) for i, s in zip(ids[0], sims[0]) if i >= 0]
+
+    def analogies(self, questions, top=1, return_similarity=False):
+        """
+        a:b = c:? の類推問題をまとめて解く．questions は (a, b, c) の単語の組の列
+        クエリは b - a + c (それぞれ正規化したもの) で，a, b, c 自身は search の exclude で除く
+        戻り値: 単語ID (n, top)．語彙にない単語を含む問題の行と，候補が足りない列は -1
+        """
+        abc = np.array([[self.word2id.get(w, -1) for w in q[:3]] for q in questions],
+                       dtype=np.int64).reshape(-1, 3)
+        ids = np.full((len(abc), top), -1)
+        sims = np.full((len(abc), top), -np.inf, dtype=np.float32)
+        known = np.flatnonzero((abc >= 0).all(axis=1))
+        if len(known):
+            a, b, c = abc[known].T
+            queries = self.vectors[b] - self.vectors[a] + self.vectors[c]
+            ids[known], sims[known] = self.search(queries, top, exclude=abc[known])
+        return (ids, sims) if return_similarity else ids
+
+    def analogy(self, a, b, c, top=5):
+        """
+        a:b = c:? の答えの候補を (単語, 類似度) のリストで返す
+        """
+        missing = [w for w in (a, b, c) if w not in self.word2id]
+        if missing:
+            print(f"{missing} is not found")
+            return []
+        ids, sims = self.analogies([(a, b, c)], top, return_similarity=True)
+        return [(self.id2word[i], float(s)) for i, s in zip(ids[0], sims[0]) if i >= 0]
+
+
+def evaluate_analogy(index, questions):
+    """
+    (a, b, c, d) の組の列で類推問題の正解率と1秒あたりの問題数を求める
+    語彙にない単語を含む問題は不正解として数える
+    """
+    start = time.perf_counter()
+    ids = index.analogies(questions, top=1)[:, 0]
+    elapsed = time.perf_counter() - start
+    answers = np.array([index.word2id.get(q[3], -2) for q in questions])
+    return float(np.mean(ids == answers)), len(questions) / elapsed
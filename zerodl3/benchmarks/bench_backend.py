@@ -0,0 +1,122 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import tracemalloc
+import numpy as np
+from dezero import Variable, Config, backend
+import dezero.functions as F
+
+#
+# MNISTと同じ大きさ(784-1000-10)の2層MLPを1エポック学習する時間とメモリ
+# float64 と float32 (Config.default_dtype) を比べる
+# 最後に，ndarray を包んだだけの別の配列型 (BoxArray) とそのモジュールをバックエンドとして登録して，
+# 演算がそのモジュールに振り分けられ，結果が NumPy で計算したものと一致することを確かめる
+#
+
+def epoch(x, t, sizes=(784, 1000, 10), batch_size=100, lr=0.1, xp=np):
+    rng = np.random.default_rng(0)
+    params = []
+    for i, o in zip(sizes[:-1], sizes[1:]):
+        params.append(Variable(backend.array(rng.standard_normal((i, o)) * np.sqrt(1 / i), xp=xp)))
+        params.append(Variable(backend.array(np.zeros(o), xp=xp)))
+    W1, b1, W2, b2 = params
+
+    for i in range(0, len(x), batch_size):
+        xb, tb = x[i:i + batch_size], t[i:i + batch_size]
+        h = F.sigmoid(F.linear(xb, W1, b1))
+        y = F.linear(h, W2, b2)
+        loss = F.softmax_cross_entropy(y, tb)
+        for p in params:
+            p.cleargrad()
+        loss.backward()
+        for p in params:
+            p.data -= lr * p.grad
+    return loss
+
+
+def _unbox(x):
+    if isinstance(x, BoxArray):
+        return x.a
+    if isinstance(x, (tuple, list)):
+        return type(x)(_unbox(v) for v in x)
+    if isinstance(x, dict):
+        return {k: _unbox(v) for k, v in x.items()}
+    return x
+
+
+def _box(x):
+    # NumPyのスカラーも0次元の配列として包む (CuPyと同じ)
+    if isinstance(x, (np.ndarray, np.generic)):
+        return BoxArray(np.asarray(x))
+    if isinstance(x, tuple):
+        return tuple(_box(v) for v in x)
+    return x
+
+
+class BoxArray(np.lib.mixins.NDArrayOperatorsMixin):
+    # ndarray を包んだだけの配列型 (ndarray のサブクラスではなく，__array__ も持たない)
+    # dezero が np を直接呼ぶと失敗するか ndarray が混ざるので，モジュールの振り分けを確かめられる
+    __slots__ = ('a',)
+
+    def __init__(self, a):
+        self.a = a
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        return _box(getattr(ufunc, method)(*_unbox(inputs), **_unbox(kwargs)))
+
+    def __getattr__(self, name):
+        attr = getattr(self.a, name)
+        if callable(attr):
+            return lambda *args, **kwargs: _box(attr(*_unbox(args), **_unbox(kwargs)))
+        return _box(attr)
+
+    def __getitem__(self, key):
+        return _box(self.a[_unbox(key)])
+
+    def __setitem__(self, key, value):
+        self.a[_unbox(key)] = _unbox(value)
+
+    def __len__(self):
+        return len(self.a)
+
+
+class BoxModule:
+    # BoxArray 用の配列モジュール (NumPy の関数に中身を渡して，結果をまた包む)
+    def __init__(self):
+        self.calls = {}
+
+    def __getattr__(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        f = getattr(np, name)
+        if isinstance(f, np.ufunc) or not callable(f):
+            return f
+        return lambda *args, **kwargs: _box(f(*_unbox(args), **_unbox(kwargs)))
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    x = rng.random((60000, 784))
+    t = rng.integers(0, 10, 60000)
+
+    for dtype in (np.float64, np.float32):
+        Config.default_dtype = dtype
+        xs = backend.array(x)
+        tracemalloc.start()
+        start = time.perf_counter()
+        loss = epoch(xs, t)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('{:8s} {:.2f}s/epoch  peak {:.1f} MiB  loss={:.4f} ({})'.format(
+            np.dtype(dtype).name, elapsed, peak / 2 ** 20, float(loss.data), loss.dtype))
+
+    Config.default_dtype = np.float64
+    xp = BoxModule()
+    backend.register_backend(BoxArray, xp)
+    loss_box = epoch(backend.array(x[:1000], xp=xp), t[:1000], xp=xp)
+    backend.unregister_backend(BoxArray)
+    loss_np = epoch(x[:1000], t[:1000])
+    print('BoxArray backend: {} calls to the module ({}), loss is {}, same as NumPy: {}'.format(
+        sum(xp.calls.values()), ', '.join(sorted(xp.calls)), type(loss_box.data).__name__,
+        np.allclose(loss_box.data.a, loss_np.data)))
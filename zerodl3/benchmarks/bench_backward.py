@@ -0,0 +1,44 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from dezero import Variable
+
+#
+# Variable.backward のスケジューリングのベンチマーク
+# ノード数 1k ~ 1M で backward の時間がノード数に線形になることを確認する
+#
+# chain: y = x + 1 + 1 + ... (キューに常に1つしか関数が積まれない)
+# wide : y = x*1 + x*2 + ... (Mulがキューに溜まっていく．ソート方式だとここが二乗になる)
+#
+
+def build_chain(x, n):
+    y = x
+    for _ in range(n):
+        y = y + 1.0
+    return y
+
+
+def build_wide(x, n):
+    y = x * 1.0
+    for i in range(1, n // 2):
+        y = y + x * float(i)
+    return y
+
+
+def bench(build, n):
+    x = Variable(np.array(1.0))
+    y = build(x, n)
+    start = time.perf_counter()
+    y.backward()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    sizes = [1000, 10000, 100000, 1000000]
+    for name, build in (('chain', build_chain), ('wide', build_wide)):
+        print(name)
+        for n in sizes:
+            t = bench(build, n)
+            print('  nodes={:>8d}  backward={:8.3f}s  {:6.2f}us/node'.format(n, t, t / n * 1e6))
@@ -0,0 +1,47 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from dezero import Variable
+import dezero.functions as F
+
+#
+# 線形回帰 y = x * w + b の二乗誤差の勾配
+# サンプルごとにPythonでループする場合と，ブロードキャストでミニバッチをまとめて流す場合
+#
+
+def per_sample(x, t, w, b):
+    w.cleargrad()
+    b.cleargrad()
+    for i in range(len(x)):
+        y = x[i] * w + b
+        loss = (y - t[i]) ** 2
+        loss.backward()  # 勾配はw, bに足し込まれていく
+    return w.grad, b.grad
+
+
+def batched(x, t, w, b):
+    w.cleargrad()
+    b.cleargrad()
+    y = x * w + b  # (N, D) * (D,) + ()
+    loss = F.sum_to((y - t) ** 2, w.shape)
+    loss.backward()
+    return w.grad, b.grad
+
+
+if __name__ == '__main__':
+    N, D = 10000, 8
+    x = np.random.rand(N, D)
+    t = np.random.rand(N, D)
+    w = Variable(np.random.rand(D))
+    b = Variable(np.array(0.0))
+
+    results = {}
+    for name, f in (('per-sample', per_sample), ('batched', batched)):
+        start = time.perf_counter()
+        results[name] = f(x, t, w, b)
+        print('{:10s} {:.4f}s'.format(name, time.perf_counter() - start))
+    gw0, gb0 = results['per-sample']
+    gw1, gb1 = results['batched']
+    print('same gradients:', np.allclose(gw0, gw1) and np.allclose(gb0, gb1))
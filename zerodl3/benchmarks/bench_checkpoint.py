@@ -0,0 +1,42 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from memory_profiler import memory_usage
+from dezero import Variable, checkpoint
+import dezero.functions as F
+
+#
+# 深い計算グラフ(tanhをdepth回重ねる)の forward + backward
+# 普通に計算する場合と，segment層ごとに checkpoint で区切る場合の
+# メモリ使用量のピーク(memory_profiler)と時間を比べる
+#
+
+def block(x, n):
+    for _ in range(n):
+        x = F.tanh(x * 0.9 + 0.1)
+    return x
+
+
+def run(segment, size=200000, depth=240):
+    x = Variable(np.random.randn(size))
+    h = x
+    if segment is None:
+        h = block(h, depth)
+    else:
+        for _ in range(depth // segment):
+            h = checkpoint(lambda h: block(h, segment), h)
+    y = F.sum(h)
+    y.backward()
+    return x.grad
+
+
+if __name__ == '__main__':
+    base = memory_usage(-1, interval=0.01, timeout=0.1, max_usage=True)
+    for segment in (None, 60, 15):
+        start = time.perf_counter()
+        peak = memory_usage((run, (segment,)), interval=0.01, max_usage=True)
+        elapsed = time.perf_counter() - start
+        name = 'no checkpoint' if segment is None else 'segment={}'.format(segment)
+        print('{:14s} peak +{:.1f} MiB  {:.2f}s'.format(name, peak - base, elapsed))
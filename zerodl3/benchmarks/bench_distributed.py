@@ -0,0 +1,58 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from dezero import Variable
+import dezero.functions as F
+import dezero.optimizers as optimizers
+from dezero.distributed import launch
+
+#
+# データ並列学習 (dezero.distributed) のスケーリング
+# 784-1000-10 のMLPを1エポック学習し，1/2/4/8プロセスでの時間を比べる
+# ミニバッチ(全体で400)を各プロセスで分け，勾配は共有メモリ上で平均してから更新する
+# 全プロセスのパラメータが1プロセスで学習したものと一致するかも確かめる
+#
+
+def init_params(rng, sizes=(784, 1000, 10)):
+    params = []
+    for i, o in zip(sizes[:-1], sizes[1:]):
+        params.append(rng.standard_normal((i, o)) * np.sqrt(1 / i))
+        params.append(np.zeros(o))
+    return params
+
+
+def train(comm, x, t, params, batch_size=400, lr=0.1):
+    W1, b1, W2, b2 = ps = [Variable(p.copy()) for p in params]
+    optimizer = optimizers.SGD(lr).setup(ps)
+    optimizer.add_hook(comm.hook)
+    start = time.perf_counter()
+    for i in range(0, len(x), batch_size):
+        xb, tb = x[i:i + batch_size], t[i:i + batch_size]
+        s = comm.shard(len(xb))
+        h = F.sigmoid(F.linear(xb[s], W1, b1))
+        loss = F.softmax_cross_entropy(F.linear(h, W2, b2), tb[s])
+        for p in ps:
+            p.cleargrad()
+        loss.backward()
+        optimizer.update()
+    return time.perf_counter() - start, [p.data.copy() for p in ps]
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((20000, 784))
+    t = rng.integers(0, 10, 20000)
+    params = init_params(rng)
+    size = sum(p.size for p in params)
+
+    print('cpus: {}'.format(os.cpu_count()))
+    base = None
+    for n in (1, 2, 4, 8):
+        results = launch(train, n, size, x, t, params)
+        elapsed = max(r[0] for r in results)
+        if base is None:
+            base = results[0][1]
+        err = max(np.abs(a - b).max() for r in results for a, b in zip(r[1], base))
+        print('{} workers  {:.2f} s/epoch  max |param - 1 worker| {:.1e}'.format(n, elapsed, err))
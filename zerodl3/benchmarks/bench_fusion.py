@@ -0,0 +1,50 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import math
+import time
+import numpy as np
+import dezero
+from dezero import Variable
+
+#
+# 要素ごとの演算の融合 (trace(fn, fuse=True)) のベンチマーク
+# 大きな配列に対して step28 のローゼンブロック関数と step27 のテイラー展開を計算する
+#
+
+def rosenbrock(x0, x1):
+    y = 100 * (x1 - x0 ** 2) ** 2 + (x0 - 1) ** 2
+    return y
+
+
+def my_sin(x, x1, terms=10):
+    y = 0
+    for i in range(terms):
+        c = (-1) ** i / math.factorial(2 * i + 1)
+        t = c * x ** (2 * i + 1)
+        y = y + t
+    return y + x1
+
+
+def bench(f, x0, x1, iters=10):
+    f(x0, x1).backward()  # traceはここで計算グラフを作る
+    start = time.perf_counter()
+    for _ in range(iters):
+        x0.cleargrad()
+        x1.cleargrad()
+        y = f(x0, x1)
+        y.backward()
+    return (time.perf_counter() - start) / iters
+
+
+if __name__ == '__main__':
+    n = 1000000
+    x0 = Variable(np.random.rand(n))
+    x1 = Variable(np.random.rand(n))
+    for fn in (rosenbrock, my_sin):
+        print(fn.__name__)
+        for name, f in (('eager', fn),
+                        ('trace', dezero.trace(fn)),
+                        ('trace+fuse', dezero.trace(fn, fuse=True))):
+            t = bench(f, x0, x1)
+            print('  {:12s} {:.2f} ms/iter'.format(name, t * 1e3))
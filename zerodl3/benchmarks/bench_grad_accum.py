@@ -0,0 +1,49 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import tracemalloc
+import numpy as np
+from dezero import Variable, GradientPool, using_config
+
+#
+# 中間変数 h を何度も使い回すグラフでの backward
+# 勾配の足し込みを毎回新しい配列で行うか，in-place + プールで行うかを比べる
+# (backwardの時間と，backward中に新たに確保したメモリのピーク)
+#
+
+def loss(w, x, fanout):
+    h = w * x
+    y = h
+    for _ in range(fanout):
+        y = y + h
+    return y
+
+
+def run(inplace, pool, shape=(1000, 1000), fanout=50, iters=10):
+    w = Variable(np.random.randn(*shape))
+    x = Variable(np.random.randn(*shape))
+
+    elapsed = 0.0
+    peak = 0
+    with using_config('inplace_grad', inplace):
+        for _ in range(iters):
+            y = loss(w, x, fanout)
+            w.cleargrad()
+            x.cleargrad()
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            y.backward(pool=pool)
+            elapsed += time.perf_counter() - start
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    return elapsed / iters, peak
+
+
+if __name__ == '__main__':
+    for name, inplace, pool in (('copy', False, None),
+                                ('inplace', True, None),
+                                ('inplace+pool', True, GradientPool())):
+        elapsed, peak = run(inplace, pool)
+        print('{:14s} backward {:.3f}s/iter  peak {:.1f} MiB'.format(name, elapsed, peak / 2 ** 20))
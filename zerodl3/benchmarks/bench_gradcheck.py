@@ -0,0 +1,87 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from dezero import Variable, gradcheck
+import dezero.functions as F
+
+#
+# 勾配確認 (backwardの勾配と中心差分の差の最大値) を演算ごとに表示し，
+# zerodl1/4.ipynb の numerical_gradient と同じ1要素ずつのループと時間を比べる
+#
+
+def numerical_gradient(f, x, h=1e-4):
+    grad = np.zeros_like(x)
+    it = np.nditer(x, flags=['multi_index'])
+    while not it.finished:
+        idx = it.multi_index
+        tmp_val = x[idx]
+        x[idx] = tmp_val + h
+        fxh1 = f(x)
+        x[idx] = tmp_val - h
+        fxh2 = f(x)
+        grad[idx] = (fxh1 - fxh2) / (2 * h)
+        x[idx] = tmp_val
+        it.iternext()
+    return grad
+
+
+def my_sin(x, n=20):
+    # step27のテイラー展開 (項は漸化式で作る)
+    t = x
+    y = t
+    for i in range(1, n):
+        t = t * x * x / (-(2 * i) * (2 * i + 1))
+        y = y + t
+    return y
+
+
+OPS = [
+    ('add', lambda x0, x1: x0 + x1, 2),
+    ('sub', lambda x0, x1: x0 - x1, 2),
+    ('mul', lambda x0, x1: x0 * x1, 2),
+    ('div', lambda x0, x1: x0 / x1, 2),
+    ('neg', lambda x: -x, 1),
+    ('pow', lambda x: x ** 3, 1),
+    ('sin', F.sin, 1),
+    ('tanh', F.tanh, 1),
+    ('exp', F.exp, 1),
+    ('sum', lambda x: F.sum(x, axis=0), 1),
+    ('matmul', lambda x, W: F.matmul(x, W.T), 2),
+    ('softmax', F.softmax, 1),
+]
+
+
+def bench(name, f, x, r, dezero_f, *args):
+    start = time.perf_counter()
+    numerical_gradient(lambda x: float(np.vdot(f(x), r)), x.copy())
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    errors = gradcheck(dezero_f, *args)
+    elapsed = time.perf_counter() - start
+    print('{:26s} loop {:6.2f}s  gradcheck {:6.2f}s  (max error {:.1e})'.format(
+        name, loop, elapsed, max(e for e in errors if e is not None)))
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    for name, f, n in OPS:
+        xs = [rng.standard_normal((3, 4)) + (3 if i else 0) for i in range(n)]
+        errors = gradcheck(f, *xs)
+        print('{:8s} max error {}'.format(name, ' '.join('{:.1e}'.format(e) for e in errors)))
+    print()
+
+    # 要素ごとの演算が多い関数では，ずらした入力をまとめて評価する方が速い
+    x = rng.standard_normal(200)
+    r = np.random.default_rng(0).standard_normal(x.shape)
+    bench('my_sin (200,)', lambda x: my_sin(Variable(x)).data, x, r, my_sin, x)
+
+    # 行列積が重い関数では1要素ずつ評価した方が速いので，gradcheckはそちらを選ぶ
+    # (配列のまま no_grad の高速パスで評価し，CPUが複数あればプロセスプールで分ける)
+    print('cpus: {}'.format(os.cpu_count()))
+    x = rng.standard_normal((1, 784))
+    W = rng.standard_normal((784, 100)) * 0.05
+    r = np.random.default_rng(0).standard_normal((1, 100))
+    bench('tanh(x @ W), W (784, 100)', lambda W: np.tanh(x.dot(W)), W, r,
+          lambda W: F.tanh(F.matmul(x, W)), W)
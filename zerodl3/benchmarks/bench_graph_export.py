@@ -0,0 +1,81 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import os
+import tempfile
+import time
+import numpy as np
+from dezero import Variable
+import dezero.functions as F
+from dezero.utils import _dot_var, _dot_func, write_dot_graph, write_json_graph
+
+#
+# 10万ノードの計算グラフの書き出し
+# 以前の get_dot_graph (文字列の += で組み立てる) と，ファイルに1パスで書き出すものを比べる
+# collapse=True で，MatMul -> Tanh を1000層重ねたグラフがどこまで小さくなるかも見る
+#
+
+def get_dot_graph_concat(output, verbose=True):
+    txt = ''
+    funcs = []
+    seen_set = set()
+
+    def add_func(f):
+        if f not in seen_set:
+            funcs.append(f)
+            seen_set.add(f)
+
+    add_func(output.creator)
+    txt += _dot_var(output, verbose)
+    while funcs:
+        func = funcs.pop()
+        txt += _dot_func(func)
+        for x in func.inputs:
+            txt += _dot_var(x, verbose)
+            if x.creator is not None:
+                add_func(x.creator)
+    return 'digraph g {\n' + txt + '}'
+
+
+def build(n):
+    x = Variable(np.ones(3), name='x')
+    y = x
+    for _ in range(n):
+        y = y + x
+    return y
+
+
+def build_mlp(n_layers):
+    h = Variable(np.ones((2, 16)), name='x')
+    for i in range(n_layers):
+        h = F.tanh(F.matmul(h, Variable(np.ones((16, 16)), name='W{}'.format(i))))
+    return F.sum(h)
+
+
+def export(path, write):
+    start = time.perf_counter()
+    with open(path, 'w') as f:
+        write(f)
+    return time.perf_counter() - start, os.path.getsize(path)
+
+
+if __name__ == '__main__':
+    y = build(100000)
+    path = os.path.join(tempfile.mkdtemp(), 'graph')
+
+    start = time.perf_counter()
+    txt = get_dot_graph_concat(y)
+    print('{:22s} {:6.2f}s  {:8.1f} KiB'.format('txt += (before)', time.perf_counter() - start,
+                                                len(txt) / 2 ** 10))
+    for name, write in (('write_dot_graph', lambda f: write_dot_graph(y, f)),
+                        ('write_json_graph', lambda f: write_json_graph(y, f)),
+                        ('dot, collapse=True', lambda f: write_dot_graph(y, f, collapse=True)),
+                        ('json, collapse=True', lambda f: write_json_graph(y, f, collapse=True))):
+        elapsed, size = export(path, write)
+        print('{:22s} {:6.2f}s  {:8.1f} KiB'.format(name, elapsed, size / 2 ** 10))
+
+    y = build_mlp(1000)
+    for name, write in (('mlp, dot', lambda f: write_dot_graph(y, f)),
+                        ('mlp, dot, collapse', lambda f: write_dot_graph(y, f, collapse=True))):
+        elapsed, size = export(path, write)
+        print('{:22s} {:6.2f}s  {:8.1f} KiB'.format(name, elapsed, size / 2 ** 10))
@@ -0,0 +1,61 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from dezero import Variable, no_grad
+from dezero.core_simple import Add, Mul
+import dezero.functions as F
+
+#
+# 小さな配列での演算の速さ (ops/秒)
+# 計算グラフを作る場合，no_gradでも関数オブジェクトとVariableを経由する場合(以前のno_grad)，
+# no_gradで配列を直接計算する場合(高速パス) を比べる
+#
+
+def mlp(x, W1, b1, W2, b2):
+    return F.softmax(F.linear(F.sigmoid(F.linear(x, W1, b1)), W2, b2))
+
+
+def elementwise(x, y, n):
+    for _ in range(n):
+        z = x * y + x
+    return z
+
+
+def elementwise_objects(x, y, n):
+    # 以前の no_grad と同じく，毎回 Function を作って __call__ を通す
+    for _ in range(n):
+        z = Add()(Mul()(x, y), x)
+    return z
+
+
+def ops_per_sec(f, n_ops, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    return n_ops / best
+
+
+if __name__ == '__main__':
+    n = 20000
+    x = Variable(np.random.randn(4))
+    y = Variable(np.random.randn(4))
+    rng = np.random.default_rng(0)
+    params = [Variable(rng.standard_normal((16, 32))), Variable(np.zeros(32)),
+              Variable(rng.standard_normal((32, 4))), Variable(np.zeros(4))]
+    xb = Variable(rng.standard_normal((1, 16)))
+
+    grad = ops_per_sec(lambda: elementwise(x, y, n), 2 * n)
+    with no_grad():
+        objects = ops_per_sec(lambda: elementwise_objects(x, y, n), 2 * n)
+        fast = ops_per_sec(lambda: elementwise(x, y, n), 2 * n)
+    print('x * y + x   grad {:9.0f}  no_grad(Function) {:9.0f}  no_grad(fast) {:9.0f} ops/s'.format(
+        grad, objects, fast))
+
+    grad = ops_per_sec(lambda: [mlp(xb, *params) for _ in range(n // 10)], n // 10)
+    with no_grad():
+        fast = ops_per_sec(lambda: [mlp(xb, *params) for _ in range(n // 10)], n // 10)
+    print('MLP 16-32-4 grad {:9.0f}  no_grad(fast) {:9.0f} inferences/s'.format(grad, fast))
@@ -0,0 +1,82 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from dezero import Variable
+from dezero.functional import jacobian, per_example_grad
+import dezero.functions as F
+
+#
+# ヤコビ行列とサンプルごとの勾配
+# 出力(サンプル)ごとに backward をやり直すループと，種をバッチ軸に並べた1回の逆伝播を比べる
+#
+
+def mlp(x, W1, b1, W2, b2):
+    return F.linear(F.tanh(F.linear(x, W1, b1)), W2, b2)
+
+
+def jacobian_loop(f, x):
+    x = Variable(x)
+    y = f(x)
+    J = np.empty(y.shape + x.shape)
+    for k in range(y.size):
+        y = f(x)
+        x.cleargrad()
+        seed = np.zeros(y.shape)
+        seed.flat[k] = 1
+        y.grad = seed
+        y.backward()
+        J.reshape(y.size, -1)[k] = x.grad.ravel()
+    return J
+
+
+def per_example_loop(x, t, params):
+    grads = [np.empty((len(x),) + p.shape) for p in params]
+    for n in range(len(x)):
+        loss = F.softmax_cross_entropy(mlp(x[n:n + 1], *params), t[n:n + 1])
+        for p in params:
+            p.cleargrad()
+        loss.backward()
+        for g, p in zip(grads, params):
+            g[n] = p.grad
+    return grads
+
+
+def per_example_batch(x, t, params):
+    y = mlp(x, *params)
+    log_p = y - F.log(F.sum(F.exp(y), axis=1, keepdims=True))
+    losses = -F.sum(log_p * np.eye(y.shape[1])[t], axis=1)
+    return per_example_grad(losses, params)
+
+
+def timeit(f, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = f(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    sizes = (64, 128, 100)
+    params = []
+    for i, o in zip(sizes[:-1], sizes[1:]):
+        params += [Variable(rng.standard_normal((i, o)) / np.sqrt(i)), Variable(np.zeros(o))]
+
+    x = rng.standard_normal((1, 64))
+    f = lambda x: F.tanh(F.linear(F.tanh(F.linear(x, params[0], params[1])), params[2], params[3]))
+    loop, J0 = timeit(jacobian_loop, f, x)
+    batch, J1 = timeit(jacobian, f, x)
+    print('jacobian (1, 100) x (1, 64)   loop {:.4f}s  batched {:.4f}s  (max diff {:.1e})'.format(
+        loop, batch, np.abs(J0 - J1).max()))
+
+    # 種はサンプル数Nだけ並ぶので，逆伝播の計算量はNの2乗に比例する (小さなバッチ向け)
+    x = rng.standard_normal((32, 64))
+    t = rng.integers(0, 100, 32)
+    loop, g0 = timeit(per_example_loop, x, t, params)
+    batch, g1 = timeit(per_example_batch, x, t, params)
+    print('per-example grad, N=32        loop {:.4f}s  batched {:.4f}s  (max diff {:.1e})'.format(
+        loop, batch, max(np.abs(a - b).max() for a, b in zip(g0, g1))))
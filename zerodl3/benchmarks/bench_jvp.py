@@ -0,0 +1,66 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from dezero import Variable
+from dezero.functional import jacfwd
+import dezero.functions as F
+
+#
+# f: R^n -> R^m のヤコビ行列を forward mode (入力ごとにjvp n回) と
+# reverse mode (出力ごとにbackward m回) で求める時間
+# 入力が少なく出力が多いときは forward，逆のときは reverse が速い
+#
+
+def my_sin(x, n=20):
+    # step27のテイラー展開 (項は漸化式で作る)
+    t = x
+    y = t
+    for i in range(1, n):
+        t = t * x * x / (-(2 * i) * (2 * i + 1))
+        y = y + t
+    return y
+
+
+def jacrev(f, *xs):
+    xs = [Variable(x) for x in xs]
+    y = f(*xs)
+    J = [np.empty((y.size,) + x.shape) for x in xs]
+    for k in range(y.size):
+        y = f(*xs)
+        for x in xs:
+            x.cleargrad()
+        seed = np.zeros(y.shape)
+        seed.flat[k] = 1
+        y.grad = seed
+        y.backward()
+        for Ji, x in zip(J, xs):
+            Ji[k] = x.grad
+    return [Ji.reshape(y.shape + x.shape) for Ji, x in zip(J, xs)]
+
+
+def timeit(f, *args):
+    start = time.perf_counter()
+    out = f(*args)
+    return time.perf_counter() - start, out
+
+
+if __name__ == '__main__':
+    grid = np.linspace(-np.pi, np.pi, 1000)
+
+    # 感度分析: 振幅と位相(n=2)を変えたときの格子上の my_sin (m=1000)
+    sweep = lambda a, b: my_sin(a * grid + b)
+    # 逆に，格子上の値(n=1000)から1つのスカラー(m=1)を作る
+    energy = lambda x: F.sum(my_sin(x) ** 2)
+
+    for name, f, xs in (('sweep  n=2, m=1000', sweep, (np.array(1.0), np.array(0.5))),
+                        ('energy n=1000, m=1', energy, (grid,))):
+        n = sum(x.size for x in xs)
+        m = f(*[Variable(x) for x in xs]).size
+        fwd, J0 = timeit(jacfwd, f, *xs)
+        rev, J1 = timeit(jacrev, f, *xs)
+        J0 = J0 if isinstance(J0, list) else [J0]
+        diff = max(np.abs(a - b).max() for a, b in zip(J0, J1))
+        print('{}  forward {:.3f}s  reverse {:.3f}s  -> {} (max diff {:.1e})'.format(
+            name, fwd, rev, 'forward' if n < m else 'reverse', diff))
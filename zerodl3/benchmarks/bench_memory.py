@@ -0,0 +1,35 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import tracemalloc
+import numpy as np
+from dezero import Variable
+
+#
+# 計算グラフ1ノード(Function + 出力Variable + 配列)あたりのメモリ使用量
+#
+
+def build(x, n):
+    y = x
+    for _ in range(n):
+        y = y + x
+    return y
+
+
+def bytes_per_node(n, shape=()):
+    x = Variable(np.ones(shape))
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    y = build(x, n)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / n
+
+
+if __name__ == '__main__':
+    n = 100000
+    for shape in [(), (10,), (1000,)]:
+        array_bytes = np.ones(shape).nbytes
+        total = bytes_per_node(n, shape)
+        print('shape={:8s} {:8.1f} bytes/node  (array data {} bytes, graph overhead {:.1f} bytes)'.format(
+            str(shape), total, array_bytes, total - array_bytes))
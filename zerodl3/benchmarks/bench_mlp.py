@@ -0,0 +1,71 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from dezero import Variable
+import dezero.functions as F
+
+#
+# MNISTと同じ大きさ(784-1000-10)の2層MLPを1エポック学習する時間
+# dezeroのテンソル演算と，同じ計算を素のNumPyで書いたものを比べる
+# (データはランダムに生成したもので代用)
+#
+
+def init_params(rng, sizes=(784, 1000, 10)):
+    params = []
+    for i, o in zip(sizes[:-1], sizes[1:]):
+        params.append(rng.standard_normal((i, o)) * np.sqrt(1 / i))
+        params.append(np.zeros(o))
+    return params
+
+
+def epoch_dezero(x, t, params, batch_size=100, lr=0.1):
+    W1, b1, W2, b2 = [Variable(p.copy()) for p in params]
+    for i in range(0, len(x), batch_size):
+        xb, tb = x[i:i + batch_size], t[i:i + batch_size]
+        h = F.sigmoid(F.linear(xb, W1, b1))
+        y = F.linear(h, W2, b2)
+        loss = F.softmax_cross_entropy(y, tb)
+        for p in (W1, b1, W2, b2):
+            p.cleargrad()
+        loss.backward()
+        for p in (W1, b1, W2, b2):
+            p.data -= lr * p.grad
+    return float(loss.data)
+
+
+def epoch_numpy(x, t, params, batch_size=100, lr=0.1):
+    W1, b1, W2, b2 = [p.copy() for p in params]
+    for i in range(0, len(x), batch_size):
+        xb, tb = x[i:i + batch_size], t[i:i + batch_size]
+        N = len(xb)
+        h = np.tanh((xb @ W1 + b1) * 0.5) * 0.5 + 0.5
+        y = h @ W2 + b2
+        y = y - y.max(axis=1, keepdims=True)
+        p = np.exp(y)
+        p /= p.sum(axis=1, keepdims=True)
+        loss = -np.log(p[np.arange(N), tb]).sum() / N
+
+        gy = p
+        gy[np.arange(N), tb] -= 1
+        gy /= N
+        gW2 = h.T @ gy
+        gb2 = gy.sum(axis=0)
+        gh = gy @ W2.T * h * (1 - h)
+        gW1 = xb.T @ gh
+        gb1 = gh.sum(axis=0)
+        for p_, g in ((W1, gW1), (b1, gb1), (W2, gW2), (b2, gb2)):
+            p_ -= lr * g
+    return float(loss)
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    x = rng.random((60000, 784))
+    t = rng.integers(0, 10, 60000)
+    params = init_params(rng)
+    for name, epoch in (('numpy', epoch_numpy), ('dezero', epoch_dezero)):
+        start = time.perf_counter()
+        loss = epoch(x, t, params)
+        print('{:7s} {:.2f}s/epoch  loss={:.4f}'.format(name, time.perf_counter() - start, loss))
@@ -0,0 +1,48 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+from dezero import Variable
+from dezero.functional import newton_step
+
+#
+# ローゼンブロック関数の最適化
+# step28の勾配降下法(10000回) と HVP + 共役勾配法によるニュートン法を比べる
+#
+
+def rosenbrock(x0, x1):
+    y = 100 * (x1 - x0 ** 2) ** 2 + (x0 - 1) ** 2
+    return y
+
+
+def gradient_descent(lr=0.001, iters=10000):
+    x0 = Variable(np.array(0.0))
+    x1 = Variable(np.array(2.0))
+    for i in range(iters):
+        y = rosenbrock(x0, x1)
+        x0.cleargrad()
+        x1.cleargrad()
+        y.backward()
+        x0.data -= lr * x0.grad
+        x1.data -= lr * x1.grad
+    return x0, x1, iters
+
+
+def newton(tol=1e-12, max_iters=100):
+    x0 = Variable(np.array(0.0))
+    x1 = Variable(np.array(2.0))
+    for i in range(max_iters):
+        y = newton_step(rosenbrock, x0, x1)
+        if float(y.data) < tol:
+            break
+    return x0, x1, i + 1
+
+
+if __name__ == '__main__':
+    for name, optimize in (('gradient descent', gradient_descent), ('newton (hvp+cg)', newton)):
+        start = time.perf_counter()
+        x0, x1, iters = optimize()
+        elapsed = time.perf_counter() - start
+        error = np.hypot(float(x0.data) - 1, float(x1.data) - 1)
+        print('{:18s} {:6d} iters  {:.4f}s  |x - x*| = {:.2e}'.format(name, iters, elapsed, error))
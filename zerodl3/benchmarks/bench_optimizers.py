@@ -0,0 +1,53 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import math
+import time
+import numpy as np
+from dezero import Variable, optimizers
+
+#
+# optimizerの1ステップあたりの時間 (パラメータ数 10 と 10000 で比べる)
+# パラメータごとにループして更新するもの(本と同じ書き方)と，連続バッファで1回で更新するものを比べる
+# (勾配は乱数で与え，backwardの時間は含めない)
+#
+
+def naive_adam(params, state, t, alpha=0.001, beta1=0.9, beta2=0.999, eps=1e-8, decay=1e-4):
+    lr = alpha * math.sqrt(1 - beta2 ** t) / (1 - beta1 ** t)
+    for p in params:
+        if id(p) not in state:
+            state[id(p)] = (np.zeros_like(p.data), np.zeros_like(p.data))
+        m, v = state[id(p)]
+        grad = p.grad + decay * p.data
+        m += (1 - beta1) * (grad - m)
+        v += (1 - beta2) * (grad * grad - v)
+        p.data -= lr * m / (np.sqrt(v) + eps)
+
+
+def run(n_tensors, size=100000, steps=20):
+    rng = np.random.default_rng(0)
+    shape = (size // n_tensors,)
+    params = [Variable(rng.standard_normal(shape)) for _ in range(n_tensors)]
+    for p in params:
+        p.grad = rng.standard_normal(shape)
+
+    state = {}
+    start = time.perf_counter()
+    for t in range(1, steps + 1):
+        naive_adam(params, state, t)
+    naive = (time.perf_counter() - start) / steps
+
+    opt = optimizers.Adam().setup(params)
+    opt.add_hook(optimizers.WeightDecay(1e-4))
+    start = time.perf_counter()
+    for _ in range(steps):
+        opt.update()
+    fused = (time.perf_counter() - start) / steps
+    return naive, fused
+
+
+if __name__ == '__main__':
+    for n in (10, 10000):
+        naive, fused = run(n)
+        print('{:6d} tensors  per-param {:.2f}ms/step  flat {:.2f}ms/step'.format(
+            n, naive * 1e3, fused * 1e3))
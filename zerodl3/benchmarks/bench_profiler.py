@@ -0,0 +1,42 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+import dezero
+from dezero import Variable
+import dezero.functions as F
+
+#
+# step17_19 の calc_memory (square を3回重ねる) を dezero.profiler で見る
+# profiler を使わないときと使うときの forward + backward の時間も比べる
+#
+
+def calc(n=10000, iters=10):
+    for _ in range(iters):
+        x = Variable(np.random.randn(n))
+        y = F.sum(((x ** 2) ** 2) ** 2)
+        y.backward()
+
+
+def timeit(f, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    with dezero.profiler() as prof:
+        calc()
+    print(prof.table())
+    prof.export_chrome_trace('calc_memory_trace.json')
+    print()
+
+    # 小さな配列で関数呼び出しのオーバーヘッドだけを見る
+    off = timeit(calc, 1, 2000)
+    with dezero.profiler():
+        on = timeit(calc, 1, 2000)
+    print('disabled {:.1f}us/iter  enabled {:.1f}us/iter'.format(off / 2000 * 1e6, on / 2000 * 1e6))
@@ -0,0 +1,48 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import tempfile
+import time
+import numpy as np
+from dezero import Variable, save_parameters, load_parameters
+
+#
+# パラメータの保存・読み込みの時間
+# 1. np.savez / np.load (全体を読み込む) と save_parameters / load_parameters (memmap) の比較
+# 2. background=True で保存したときに，呼び出し側が止まる時間
+#
+
+def make_params(n_layers=8, width=2048):
+    rng = np.random.default_rng(0)
+    params = {}
+    for i in range(n_layers):
+        params['W{}'.format(i)] = Variable(rng.standard_normal((width, width)).astype(np.float32))
+        params['b{}'.format(i)] = Variable(np.zeros(width, dtype=np.float32))
+    return params
+
+
+def timeit(f):
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    params = make_params()
+    nbytes = sum(p.data.nbytes for p in params.values())
+    print('parameters: {:.0f} MiB'.format(nbytes / 2 ** 20))
+
+    with tempfile.TemporaryDirectory() as d:
+        npz, raw = os.path.join(d, 'p.npz'), os.path.join(d, 'p.bin')
+        t_save, _ = timeit(lambda: np.savez(npz, **{k: p.data for k, p in params.items()}))
+        t_load, _ = timeit(lambda: {k: v for k, v in np.load(npz).items()})
+        print('np.savez / np.load          save {:.3f} s  load {:.4f} s'.format(t_save, t_load))
+
+        t_save, _ = timeit(lambda: save_parameters(params, raw))
+        t_load, arrays = timeit(lambda: load_parameters(raw))
+        ok = all(np.array_equal(arrays[k], p.data) for k, p in params.items())
+        print('save_parameters / load      save {:.3f} s  load {:.4f} s  equal {}'.format(t_save, t_load, ok))
+
+        t_call, future = timeit(lambda: save_parameters(params, raw, background=True))
+        t_join, _ = timeit(future.result)
+        print('background save             call {:.3f} s  (writer finished {:.3f} s later)'.format(t_call, t_join))
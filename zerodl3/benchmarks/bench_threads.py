@@ -0,0 +1,71 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dezero import Variable, no_grad
+import dezero.functions as F
+
+#
+# スレッドごとに Config を持てることの確認と，スレッドを使った推論のスループット
+# 1. 学習(計算グラフを作る)スレッドと no_grad の推論スレッドを同時に走らせ，互いのモードが混ざらないか
+# 2. 大きな行列積(NumPyがGILを解放する)の推論を 1, 2, 4 スレッドで実行したときの処理数/秒
+#
+
+def train_worker(W, iters, errors):
+    x = Variable(np.random.randn(8, 64))
+    for _ in range(iters):
+        y = F.sum(F.tanh(F.matmul(x, W)))
+        if y.creator is None:
+            errors.append('train: graph was not built')
+        W.cleargrad()
+        y.backward()
+
+
+def infer_worker(W, iters, errors):
+    x = Variable(np.random.randn(8, 64))
+    with no_grad():
+        for _ in range(iters):
+            y = F.sum(F.tanh(F.matmul(x, W)))
+            if y.creator is not None:
+                errors.append('infer: graph was built under no_grad')
+
+
+def check_isolation(iters=20000):
+    W = Variable(np.random.randn(64, 64))
+    errors = []
+    threads = [threading.Thread(target=train_worker, args=(W, iters, errors)),
+               threading.Thread(target=infer_worker, args=(W, iters, errors))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def infer(x, params):
+    with no_grad():
+        h = F.sigmoid(F.linear(x, params[0], params[1]))
+        return F.softmax(F.linear(h, params[2], params[3])).data
+
+
+def throughput(n_threads, batches, params):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(n_threads) as executor:
+        list(executor.map(lambda x: infer(x, params), batches))
+    return len(batches) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    errors = check_isolation()
+    print('isolation: {}'.format('ok' if not errors else '{} errors, e.g. {}'.format(len(errors), errors[0])))
+
+    rng = np.random.default_rng(0)
+    params = [Variable(rng.standard_normal((784, 1000)) * 0.03), Variable(np.zeros(1000)),
+              Variable(rng.standard_normal((1000, 10)) * 0.03), Variable(np.zeros(10))]
+    batches = [Variable(rng.standard_normal((256, 784))) for _ in range(64)]
+    print('cpus: {}'.format(os.cpu_count()))
+    for n in (1, 2, 4):
+        print('{} threads  {:.1f} batches/s'.format(n, throughput(n, batches, params)))
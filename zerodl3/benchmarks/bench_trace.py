@@ -0,0 +1,37 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import numpy as np
+import dezero
+from dezero import Variable
+
+#
+# step28 のローゼンブロック関数の最適化ループを eager と trace で比較する
+#
+
+def rosenbrock(x0, x1):
+    y = 100 * (x1 - x0 ** 2) ** 2 + (x0 - 1) ** 2
+    return y
+
+
+def optimize(f, lr=0.001, iters=10000):
+    x0 = Variable(np.array(0.0))
+    x1 = Variable(np.array(2.0))
+    for i in range(iters):
+        y = f(x0, x1)
+        x0.cleargrad()
+        x1.cleargrad()
+        y.backward()
+
+        x0.data -= lr * x0.grad
+        x1.data -= lr * x1.grad
+    return x0, x1
+
+
+if __name__ == '__main__':
+    for name, f in (('eager', rosenbrock), ('trace', dezero.trace(rosenbrock))):
+        start = time.perf_counter()
+        x0, x1 = optimize(f)
+        elapsed = time.perf_counter() - start
+        print('{:6s} {:.3f}s  x0={:.6f} x1={:.6f}'.format(name, elapsed, float(x0.data), float(x1.data)))
@@ -1,11 +1,23 @@
 from dezero.core_simple import Variable
+from dezero.core_simple import Config
 from dezero.core_simple import Function
+from dezero.core_simple import GradientPool
 from dezero.core_simple import using_config
 from dezero.core_simple import no_grad
 from dezero.core_simple import as_array
 from dezero.core_simple import as_variable
 from dezero.core_simple import setup_variable
+from dezero.tracing import trace
+from dezero.checkpointing import checkpoint
+from dezero.utils import gradcheck
+from dezero.profiling import profiler
+from dezero.serializers import save_parameters
+from dezero.serializers import load_parameters
 
 import dezero.utils
+import dezero.functions
+import dezero.functional
+import dezero.optimizers
+import dezero.distributed
 
 setup_variable()
\ No newline at end of file
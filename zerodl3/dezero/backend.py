@@ -0,0 +1,47 @@
+import numpy as np
+import dezero
+
+
+# =============================================================================
+# 配列ライブラリの切り替え (NumPy / CuPy 互換のモジュール)
+# =============================================================================
+_backends = [(np.ndarray, np)]
+_array_types = (np.ndarray,)
+
+
+def register_backend(array_type, array_module):
+    # 後から登録したものを優先する
+    global _array_types
+    _backends.insert(0, (array_type, array_module))
+    _array_types = tuple(t for t, _ in _backends)
+
+
+def unregister_backend(array_type):
+    global _array_types
+    _backends[:] = [b for b in _backends if b[0] is not array_type]
+    _array_types = tuple(t for t, _ in _backends)
+
+
+def array_types():
+    return _array_types
+
+
+def is_array(x):
+    return isinstance(x, _array_types)
+
+
+def get_array_module(x):
+    if isinstance(x, dezero.Variable):
+        x = x.data
+    for array_type, xp in _backends:
+        if isinstance(x, array_type):
+            return xp
+    return np
+
+
+def array(obj, dtype=None, xp=np):
+    # 浮動小数点数は Config.default_dtype で作る
+    a = xp.asarray(obj)
+    if dtype is None and a.dtype.kind == 'f':
+        dtype = dezero.Config.default_dtype
+    return a if dtype is None else a.astype(dtype, copy=False)
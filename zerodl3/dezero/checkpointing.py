@@ -0,0 +1,91 @@
+from dezero import backend
+from dezero.core_simple import Config
+from dezero.core_simple import Function
+from dezero.core_simple import Variable
+from dezero.core_simple import as_array
+from dezero.core_simple import as_variable
+from dezero.core_simple import no_grad
+from dezero.core_simple import using_config
+
+
+# =============================================================================
+# checkpoint: 区間内の中間結果を捨てて，逆伝播のときに計算し直す
+# =============================================================================
+class Checkpoint(Function):
+    __slots__ = ('fn', 'multi_output')
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.multi_output = False
+
+    def forward(self, *xs):
+        # 計算グラフを作らずに実行するので，中間のVariableはすぐに解放される
+        with no_grad():
+            ys = self.fn(*[Variable(x) for x in xs])
+        self.multi_output = isinstance(ys, (tuple, list))
+        if not self.multi_output:
+            return as_variable(as_array(ys)).data
+        return tuple(as_variable(as_array(y)).data for y in ys)
+
+    def backward(self, *gys):
+        if any(isinstance(gy, Variable) for gy in gys):
+            raise NotImplementedError('create_graph is not supported for checkpoint')
+
+        xs = [Variable(x.data) for x in self.inputs]
+        funcs = set()  # 再計算で作られた Function
+        with using_config('enable_backprop', True), using_config('created_functions', funcs):
+            ys = self.fn(*xs)
+        if not self.multi_output:
+            ys = (ys,)
+        _check_boundary(ys, funcs)
+
+        # 出力ごとに種を入れて逆伝播する (勾配はxsに足し込まれていく)
+        for y, gy in zip(ys, gys):
+            if gy is None or not isinstance(y, Variable):
+                continue
+            if y.creator is None:
+                # fnが入力をそのまま返した場合
+                y.grad = gy if y.grad is None else y.grad + gy
+                continue
+            y.grad = gy
+            y.backward()
+
+        gxs = []
+        for x in xs:
+            if x.grad is None:
+                xp = backend.get_array_module(x.data)
+                gxs.append(xp.zeros_like(x.data))
+            else:
+                gxs.append(x.grad)
+        return tuple(gxs)
+
+    def jvp(self, xs, ts, ys):
+        # 接ベクトルを付けてfnをもう一度実行する (区間内の関数が接ベクトルを流す)
+        tangents = Config.tangents
+        vs = [Variable(x) for x in xs]
+        for v, t in zip(vs, ts):
+            if t is not None:
+                tangents[v] = t
+        with no_grad():
+            outs = self.fn(*vs)
+        if not self.multi_output:
+            outs = (outs,)
+        return tuple(tangents.get(y) if isinstance(y, Variable) else None for y in outs)
+
+
+def _check_boundary(ys, funcs):
+    # 内側の逆伝播は区間の外に出てはいけない．fnが閉じ込めてよいのは葉のVariable(パラメータ)だけで，
+    # 区間の外で計算された途中のVariableを使うと，外側の逆伝播の勾配を壊してしまう
+    for f in funcs:
+        for x in f.inputs:
+            if x.creator is not None and x.creator not in funcs:
+                raise ValueError('checkpoint: fn uses a non-leaf Variable computed outside the segment; '
+                                 'pass it as an argument of checkpoint instead')
+    for y in ys:
+        if isinstance(y, Variable) and y.creator is not None and y.creator not in funcs:
+            raise ValueError('checkpoint: fn returns a non-leaf Variable computed outside the segment')
+
+
+def checkpoint(fn, *args):
+    # fn が引数以外で使ってよいのは葉のVariableだけ (途中のVariableは引数で渡す)
+    return Checkpoint(fn)(*[as_variable(as_array(x)) for x in args])
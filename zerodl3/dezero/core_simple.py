@@ -1,23 +1,89 @@
+import contextvars
+import heapq
+import itertools
+import threading
+import time
 import weakref
 import numpy as np
 import contextlib
+import dezero
+from dezero import backend
 
 
 # =============================================================================
 # Config
 # =============================================================================
-class Config:
-    enable_backprop = True
+# using_config で変えた値はコンテキスト(スレッド / asyncioのタスク)ごとに持つ
+# Config.xxx = ... と代入したときは全体の既定値が変わる
+_defaults = {
+    'enable_backprop': True,
+    'inplace_grad': True,
+    'default_dtype': np.float32,
+    'batch_grad': False,  # 勾配の先頭に種ごとのバッチ軸がある (jacobianなど)
+    'tangents': None,     # forward mode中は Variable -> 接ベクトル の WeakKeyDictionary
+    'profiler': None,     # dezero.profiler() の中では Profiler
+    'created_functions': None,  # checkpoint の再計算中は，計算グラフに加わった Function を入れる set
+}
+
+
+class _ConfigState:
+    # 設定値の組．ContextVar にはこれを1つ入れておき，よく通る処理では一度 get() して属性を読む
+    # using_config のたびに新しく作り，後から変わるのは Config.xxx = ... で既定値を変えたときだけ
+    __slots__ = tuple(_defaults) + ('overrides', '__weakref__')
+
+    def __init__(self, overrides):
+        self.overrides = overrides
+        for name, value in _defaults.items():
+            setattr(self, name, overrides.get(name, value))
+
+
+_default_config = _ConfigState({})
+_local_config = contextvars.ContextVar('dezero_config', default=_default_config)
+_config_states = weakref.WeakSet([_default_config])
+_config_lock = threading.Lock()
+
+
+def _config_property(name):
+    def fget(cls):
+        return getattr(_local_config.get(), name)
+
+    def fset(cls, value):
+        # 既定値を変え，その値を上書きしていない全ての設定の組にも反映する
+        with _config_lock:
+            _defaults[name] = value
+            for state in _config_states:
+                if name not in state.overrides:
+                    setattr(state, name, value)
+
+    return property(fget, fset)
+
+
+class _ConfigMeta(type):
+    pass
+
+
+class Config(metaclass=_ConfigMeta):
+    _defaults = _defaults
+
+
+for _name in _defaults:
+    setattr(_ConfigMeta, _name, _config_property(_name))
 
 
 @contextlib.contextmanager
 def using_config(name, value):
-    old_value = getattr(Config, name)
-    setattr(Config, name, value)
+    if name not in _defaults:
+        raise AttributeError("type object 'Config' has no attribute '{}'".format(name))
+    overrides = dict(_local_config.get().overrides)
+    overrides[name] = value
+    with _config_lock:
+        state = _ConfigState(overrides)
+        _config_states.add(state)
+    token = _local_config.set(state)
     try:
         yield
     finally:
-        setattr(Config, name, old_value)
+        _local_config.reset(token)
 
 
 def no_grad():
@@ -28,11 +94,12 @@ def no_grad():
 # Variable / Function
 # =============================================================================
 class Variable:
+    __slots__ = ('data', 'name', 'grad', 'creator', 'generation', '__weakref__')
     __array_priority__ = 200
 
     def __init__(self, data, name=None):
         if data is not None:
-            if not isinstance(data, np.ndarray):
+            if not backend.is_array(data):
                 raise TypeError('{} is not supported'.format(type(data)))
 
         self.data = data
@@ -66,6 +133,26 @@ class Variable:
         p = str(self.data).replace('\n', '\n' + ' ' * 9)
         return 'variable(' + p + ')'
 
+    def reshape(self, *shape):
+        if len(shape) == 1 and isinstance(shape[0], (tuple, list)):
+            shape = shape[0]
+        return dezero.functions.reshape(self, shape)
+
+    def transpose(self, *axes):
+        if len(axes) == 0:
+            axes = None
+        elif len(axes) == 1:
+            if isinstance(axes[0], (tuple, list)) or axes[0] is None:
+                axes = axes[0]
+        return dezero.functions.transpose(self, axes)
+
+    @property
+    def T(self):
+        return dezero.functions.transpose(self)
+
+    def sum(self, axis=None, keepdims=False):
+        return dezero.functions.sum(self, axis, keepdims)
+
     def set_creator(self, func):
         self.creator = func
         self.generation = func.generation + 1
@@ -73,40 +160,121 @@ class Variable:
     def cleargrad(self):
         self.grad = None
 
-    def backward(self, retain_grad=False):
+    def backward(self, retain_grad=False, create_graph=False, pool=None):
+        seed = None
         if self.grad is None:
-            self.grad = np.ones_like(self.data)
-
+            xp = backend.get_array_module(self.data)
+            if create_graph:
+                self.grad = Variable(xp.ones_like(self.data))
+            elif pool is None or self.creator is None or retain_grad:
+                self.grad = xp.ones_like(self.data)
+            else:
+                # 使い回す種 (書き込み不可) は，そのまま通す関数を経て葉の勾配にならないようにする
+                self.grad = seed = pool.ones(self.data.shape, self.data.dtype, xp)
+
+        # generationの大きい順に取り出すヒープ (同世代は追加順)
         funcs = []
         seen_set = set()
+        counter = itertools.count()
 
         def add_func(f):
             if f not in seen_set:
-                funcs.append(f)
+                heapq.heappush(funcs, (-f.generation, next(counter), f))
                 seen_set.add(f)
-                funcs.sort(key=lambda x: x.generation)
 
-        add_func(self.creator)
+        # このbackward内で確保した勾配バッファ (id(x) -> 配列)
+        # これらは他から参照されていないので，in-placeに足し込んでよい
+        config = _local_config.get()
+        inplace = config.inplace_grad
+        prof = config.profiler
+        owned = {}
+
+        if self.creator is not None:
+            add_func(self.creator)
 
         while funcs:
-            f = funcs.pop()
+            f = heapq.heappop(funcs)[2]
             gys = [output().grad for output in f.outputs]  # output is weakref
-            gxs = f.backward(*gys)
+            if prof is not None:
+                start = time.perf_counter()
+            if create_graph:
+                # 勾配をVariableのまま計算し，逆伝播の計算グラフも作る
+                with using_config('enable_backprop', True):
+                    gxs = f.backward(*gys)
+            else:
+                gxs = f.backward(*gys)
             if not isinstance(gxs, tuple):
                 gxs = (gxs,)
+            if prof is not None:
+                prof.record(f, 'backward', start, [_data(gx) for gx in gxs])
 
             for x, gx in zip(f.inputs, gxs):
+                if seed is not None and (x.creator is None or retain_grad) and \
+                        backend.is_array(gx) and _may_share_memory(gx, seed):
+                    gx = gx.copy()
                 if x.grad is None:
                     x.grad = gx
-                else:
+                elif not inplace or create_graph:
                     x.grad = x.grad + gx
+                elif owned.get(id(x)) is x.grad and x.grad.shape == gx.shape and \
+                        x.grad.dtype == gx.dtype:
+                    buf = x.grad
+                    buf += gx
+                else:
+                    # 受け取った勾配は他の変数と共有されている可能性があるので新しく確保する
+                    if pool is None or not backend.is_array(x.grad):
+                        buf = x.grad + gx
+                    else:
+                        xp = backend.get_array_module(x.grad)
+                        buf = pool.acquire(np.broadcast_shapes(x.grad.shape, gx.shape),
+                                           xp.result_type(x.grad, gx), xp)
+                        xp.add(x.grad, gx, out=buf)
+                    x.grad = buf
+                    if backend.is_array(buf):
+                        owned[id(x)] = buf
 
                 if x.creator is not None:
                     add_func(x.creator)
 
             if not retain_grad:
                 for y in f.outputs:
-                    y().grad = None  # y is weakref
+                    y = y()  # y is weakref
+                    buf = owned.pop(id(y), None)
+                    if pool is not None and buf is y.grad is not None and \
+                            not any(_may_share_memory(buf, gx) for gx in gxs):
+                        pool.release(buf)
+                    y.grad = None
+
+
+class GradientPool:
+    def __init__(self):
+        self._free = {}
+        self._ones = {}
+
+    def acquire(self, shape, dtype, xp=np):
+        bufs = self._free.get((shape, dtype, xp))
+        if bufs:
+            return bufs.pop()
+        return xp.empty(shape, dtype=dtype)
+
+    def release(self, buf):
+        xp = backend.get_array_module(buf)
+        self._free.setdefault((buf.shape, buf.dtype, xp), []).append(buf)
+
+    def ones(self, shape, dtype, xp=np):
+        # 逆伝播の種．使い回すので書き込み不可にしておく (書き込み不可にできない配列は使い回さない)
+        key = (shape, dtype, xp)
+        if key not in self._ones:
+            seed = xp.ones(shape, dtype=dtype)
+            if not hasattr(seed, 'flags'):
+                return seed
+            seed.flags.writeable = False
+            self._ones[key] = seed
+        return self._ones[key]
+
+    def clear(self):
+        self._free.clear()
+        self._ones.clear()
 
 
 def as_variable(obj):
@@ -115,124 +283,282 @@ def as_variable(obj):
     return Variable(obj)
 
 
-def as_array(x):
+def as_array(x, array_module=np):
     if np.isscalar(x):
-        return np.array(x)
+        if type(x) is float:
+            # Pythonの浮動小数点数は Config.default_dtype で作る (NumPyのスカラーはそのdtypeのまま)
+            return backend.array(x, xp=array_module)
+        return array_module.array(x)
     return x
 
 
+def _as_operand(x, other):
+    # Pythonのスカラーは相手の配列のdtypeに合わせる (float32の計算がfloat64に昇格しないように)
+    if isinstance(x, Variable):
+        return x
+    if not isinstance(x, (int, float, complex)) or isinstance(x, np.generic):
+        return as_array(x)
+    data = other.data if isinstance(other, Variable) else other
+    xp = backend.get_array_module(data)
+    return xp.asarray(x, dtype=np.result_type(data.dtype, x))
+
+
+def _may_share_memory(a, b):
+    xp = backend.get_array_module(a)
+    if not hasattr(xp, 'may_share_memory'):
+        return True
+    return xp.may_share_memory(a, b)
+
+
+def _data(x):
+    return x.data if isinstance(x, Variable) else x
+
+
+def _operands(inputs, gy):
+    # create_graph時(gyがVariable)は入力をVariableのまま使い，逆伝播も微分可能にする
+    if isinstance(gy, Variable):
+        return inputs
+    return tuple([x.data for x in inputs])
+
+
+def _nbatch():
+    return 1 if _local_config.get().batch_grad else 0
+
+
+def _sum_to(gx, shape):
+    # ブロードキャストされた入力の勾配を元の形状に戻す
+    nbatch = _nbatch()
+    if gx.shape[nbatch:] == shape:
+        return gx
+    if isinstance(gx, Variable):
+        return dezero.functions.sum_to(gx, shape)
+    return dezero.utils.sum_to(gx, shape, nbatch)
+
+
+def _tsum(*ts):
+    # 接ベクトルの和 (Noneは0として扱う)
+    t = None
+    for ti in ts:
+        if ti is not None:
+            t = ti if t is None else t + ti
+    return t
+
+
+def _tmul(t, x):
+    return None if t is None else t * x
+
+
 class Function:
+    __slots__ = ('inputs', 'outputs', 'generation')
+
     def __call__(self, *inputs):
-        inputs = [as_variable(x) for x in inputs]
+        inputs = tuple([as_variable(x) for x in inputs])
 
         xs = [x.data for x in inputs]
+        config = _local_config.get()
+        prof = config.profiler
+        if prof is not None:
+            start = time.perf_counter()
         ys = self.forward(*xs)
         if not isinstance(ys, tuple):
             ys = (ys,)
         outputs = [Variable(as_array(y)) for y in ys]
+        if prof is not None:
+            prof.record(self, 'forward', start, [y.data for y in outputs])
 
-        if Config.enable_backprop:
+        if config.enable_backprop:
             self.generation = max([x.generation for x in inputs])
             for output in outputs:
                 output.set_creator(self)
             self.inputs = inputs
-            self.outputs = [weakref.ref(output) for output in outputs]
+            self.outputs = tuple([weakref.ref(output) for output in outputs])
+            created = config.created_functions
+            if created is not None:
+                created.add(self)
+
+        if config.tangents is not None:
+            self._push_tangents(inputs, xs, ys, outputs)
 
         return outputs if len(outputs) > 1 else outputs[0]
 
+    def _push_tangents(self, inputs, xs, ys, outputs):
+        # forward mode: 入力の接ベクトルから出力の接ベクトルを求める (計算グラフは作らない)
+        tangents = Config.tangents
+        ts = [tangents.get(x) for x in inputs]
+        if all(t is None for t in ts):
+            return
+        tys = self.jvp(xs, ts, ys)
+        if not isinstance(tys, tuple):
+            tys = (tys,)
+        for output, ty in zip(outputs, tys):
+            if ty is None:
+                continue
+            if ty.shape != output.shape:
+                xp = backend.get_array_module(ty)
+                ty = xp.broadcast_to(ty, output.shape)
+            tangents[output] = ty
+
     def forward(self, xs):
         raise NotImplementedError()
 
     def backward(self, gys):
         raise NotImplementedError()
 
+    def jvp(self, xs, ts, ys):
+        # ts[i] は i番目の入力の接ベクトル (Noneは0)
+        raise NotImplementedError()
+
+
+# =============================================================================
+# 推論用の高速パス: no_grad中は関数オブジェクトを作らずに配列を直接計算する
+# =============================================================================
+_op_cache = {}
+
+
+def _apply(f, *inputs):
+    # f は状態を持たない関数のクラス (インスタンスを使い回す) か，関数のインスタンス
+    config = _local_config.get()
+    if config.enable_backprop or config.tangents is not None or config.profiler is not None:
+        return (f() if isinstance(f, type) else f)(*inputs)
+    if isinstance(f, type):
+        op = _op_cache.get(f)
+        if op is None:
+            op = _op_cache[f] = f()
+        f = op
+    y = f.forward(*[x.data if isinstance(x, Variable) else x for x in inputs])
+    if not backend.is_array(y):
+        y = as_array(y)
+    # __init__の型チェックは省く (yは配列)
+    out = Variable.__new__(Variable)
+    out.data = y
+    out.name = None
+    out.grad = None
+    out.creator = None
+    out.generation = 0
+    return out
+
 
 # =============================================================================
 # 四則演算 / 演算子のオーバーロード
 # =============================================================================
 class Add(Function):
+    __slots__ = ()
+
     def forward(self, x0, x1):
         y = x0 + x1
         return y
 
     def backward(self, gy):
-        return gy, gy
+        x0, x1 = self.inputs
+        return _sum_to(gy, x0.shape), _sum_to(gy, x1.shape)
+
+    def jvp(self, xs, ts, ys):
+        return _tsum(*ts)
 
 
 def add(x0, x1):
-    x1 = as_array(x1)
-    return Add()(x0, x1)
+    x1 = _as_operand(x1, x0)
+    return _apply(Add, x0, x1)
 
 
 class Mul(Function):
+    __slots__ = ()
+
     def forward(self, x0, x1):
         y = x0 * x1
         return y
 
     def backward(self, gy):
-        x0, x1 = self.inputs[0].data, self.inputs[1].data
-        return gy * x1, gy * x0
+        x0, x1 = _operands(self.inputs, gy)
+        return _sum_to(gy * x1, x0.shape), _sum_to(gy * x0, x1.shape)
+
+    def jvp(self, xs, ts, ys):
+        x0, x1 = xs
+        t0, t1 = ts
+        return _tsum(_tmul(t0, x1), _tmul(t1, x0))
 
 
 def mul(x0, x1):
-    x1 = as_array(x1)
-    return Mul()(x0, x1)
+    x1 = _as_operand(x1, x0)
+    return _apply(Mul, x0, x1)
 
 
 class Neg(Function):
+    __slots__ = ()
+
     def forward(self, x):
         return -x
 
     def backward(self, gy):
         return -gy
 
+    def jvp(self, xs, ts, ys):
+        return -ts[0]
+
 
 def neg(x):
-    return Neg()(x)
+    return _apply(Neg, x)
 
 
 class Sub(Function):
+    __slots__ = ()
+
     def forward(self, x0, x1):
         y = x0 - x1
         return y
 
     def backward(self, gy):
-        return gy, -gy
+        x0, x1 = self.inputs
+        return _sum_to(gy, x0.shape), _sum_to(-gy, x1.shape)
+
+    def jvp(self, xs, ts, ys):
+        t0, t1 = ts
+        return _tsum(t0, None if t1 is None else -t1)
 
 
 def sub(x0, x1):
-    x1 = as_array(x1)
-    return Sub()(x0, x1)
+    x1 = _as_operand(x1, x0)
+    return _apply(Sub, x0, x1)
 
 
 def rsub(x0, x1):
-    x1 = as_array(x1)
-    return Sub()(x1, x0)
+    x1 = _as_operand(x1, x0)
+    return _apply(Sub, x1, x0)
 
 
 class Div(Function):
+    __slots__ = ()
+
     def forward(self, x0, x1):
         y = x0 / x1
         return y
 
     def backward(self, gy):
-        x0, x1 = self.inputs[0].data, self.inputs[1].data
+        x0, x1 = _operands(self.inputs, gy)
         gx0 = gy / x1
         gx1 = gy * (-x0 / x1 ** 2)
-        return gx0, gx1
+        return _sum_to(gx0, x0.shape), _sum_to(gx1, x1.shape)
+
+    def jvp(self, xs, ts, ys):
+        x0, x1 = xs
+        t0, t1 = ts
+        y, = ys
+        return _tsum(t0, _tmul(t1, -y)) / x1
 
 
 def div(x0, x1):
-    x1 = as_array(x1)
-    return Div()(x0, x1)
+    x1 = _as_operand(x1, x0)
+    return _apply(Div, x0, x1)
 
 
 def rdiv(x0, x1):
-    x1 = as_array(x1)
-    return Div()(x1, x0)
+    x1 = _as_operand(x1, x0)
+    return _apply(Div, x1, x0)
 
 
 class Pow(Function):
+    __slots__ = ('c',)
+
     def __init__(self, c):
         self.c = c
 
@@ -241,15 +567,24 @@ class Pow(Function):
         return y
 
     def backward(self, gy):
-        x = self.inputs[0].data
+        x, = _operands(self.inputs, gy)
         c = self.c
 
         gx = c * x ** (c - 1) * gy
         return gx
 
+    def jvp(self, xs, ts, ys):
+        x, = xs
+        c = self.c
+        return c * x ** (c - 1) * ts[0]
+
 
 def pow(x, c):
-    return Pow(c)(x)
+    return _apply(Pow(c), x)
+
+
+def rmatmul(x0, x1):
+    return dezero.functions.matmul(x1, x0)
 
 
 def setup_variable():
@@ -262,4 +597,6 @@ def setup_variable():
     Variable.__rsub__ = rsub
     Variable.__truediv__ = div
     Variable.__rtruediv__ = rdiv
-    Variable.__pow__ = pow
\ No newline at end of file
+    Variable.__pow__ = pow
+    Variable.__matmul__ = dezero.functions.matmul
+    Variable.__rmatmul__ = rmatmul
\ No newline at end of file
@@ -0,0 +1,130 @@
+import multiprocessing
+import queue as queue_module
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+
+
+# =============================================================================
+# データ並列: プロセスごとにミニバッチの一部を計算し，勾配を共有メモリで平均する
+# =============================================================================
+class Communicator:
+    def __init__(self, rank, world_size, shm, size, barrier):
+        self.rank = rank
+        self.world_size = world_size
+        self.size = size
+        self.barrier = barrier
+        # 各プロセスの勾配を並べる領域 (world_size, size) と，平均を書き込む領域 (size,)
+        self.bufs = np.ndarray((world_size, size), dtype=np.float64, buffer=shm.buf)
+        self.out = np.ndarray((size,), dtype=np.float64, buffer=shm.buf,
+                              offset=world_size * size * 8)
+
+    def shard(self, n):
+        # n個のデータのうち，このプロセスが受け持つ範囲
+        per = -(-n // self.world_size)
+        return slice(self.rank * per, min((self.rank + 1) * per, n))
+
+    def allreduce(self, x):
+        # x を全プロセスでの平均で置き換える (全プロセスが同じ順番で呼ぶこと)
+        flat = x.reshape(-1)
+        n = flat.size
+        if n > self.size:
+            raise ValueError('allreduce buffer is too small: {} > {}'.format(n, self.size))
+        self.bufs[self.rank, :n] = flat
+        self.barrier.wait()
+
+        # reduce-scatter: 各プロセスは自分の担当区間だけを足し合わせる
+        per = -(-n // self.world_size)
+        lo, hi = min(self.rank * per, n), min((self.rank + 1) * per, n)
+        if lo < hi:
+            np.sum(self.bufs[:, lo:hi], axis=0, out=self.out[lo:hi])
+            self.out[lo:hi] /= self.world_size
+        self.barrier.wait()
+
+        # all-gather: 平均は共有メモリにあるので，全体を読むだけでよい
+        flat[...] = self.out[:n]
+        return x
+
+    def hook(self, data, grad):
+        # optimizers の hook として使う (連続バッファの勾配をまとめて平均する)
+        self.allreduce(grad)
+
+
+def _worker(fn, rank, world_size, shm_name, size, barrier, queue, args):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    comm = None
+    try:
+        comm = Communicator(rank, world_size, shm, size, barrier)
+        queue.put((rank, True, fn(comm, *args)))
+    except BaseException as e:
+        # 原因を先に送ってから，他のプロセスが barrier で待ち続けないようにする
+        queue.put((rank, False, (isinstance(e, threading.BrokenBarrierError), traceback.format_exc())))
+        barrier.abort()
+    finally:
+        del comm
+        shm.close()
+
+
+def _collect(procs, queue, barrier, poll=0.1, grace=1.0):
+    # 全ワーカーの結果を集める．何も返さずに終了したワーカー (OOM kill, segfault, os._exit) がいたら，
+    # barrier を壊して残りを止め，例外にする (待ち続けないように)
+    results = [None] * len(procs)
+    received = set()
+    errors = []
+    exited_at = {}
+    while len(received) < len(procs):
+        try:
+            rank, ok, result = queue.get(timeout=poll)
+        except queue_module.Empty:
+            now = time.monotonic()
+            for rank, p in enumerate(procs):
+                if rank in received or p.exitcode is None:
+                    continue
+                # 正常終了でも結果がまだパイプに残っていることがあるので少し待つ
+                exited_at.setdefault(rank, now)
+                if p.exitcode != 0 or now - exited_at[rank] > grace:
+                    barrier.abort()
+                    raise RuntimeError('worker {} exited with code {} without returning a result'.format(
+                        rank, p.exitcode))
+            continue
+        received.add(rank)
+        if ok:
+            results[rank] = result
+        else:
+            errors.append(result)
+    return results, errors
+
+
+def launch(fn, world_size, size, *args):
+    # fn(comm, *args) を world_size 個のプロセスで実行し，rank順に戻り値を返す
+    # size は一度に allreduce する要素数の上限 (パラメータの総数にしておけばよい)
+    ctx = multiprocessing.get_context('fork')
+    shm = shared_memory.SharedMemory(create=True, size=(world_size + 1) * size * 8)
+    barrier = ctx.Barrier(world_size)
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_worker,
+                         args=(fn, rank, world_size, shm.name, size, barrier, queue, args))
+             for rank in range(world_size)]
+    try:
+        for p in procs:
+            p.start()
+        results, errors = _collect(procs, queue, barrier)
+        for p in procs:
+            p.join()
+    finally:
+        # 異常終了したときは残りのワーカーを止めてから共有メモリを解放する
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+            if p.pid is not None:
+                p.join()
+        shm.close()
+        shm.unlink()
+
+    if errors:
+        # 他のワーカーの失敗で barrier が壊れただけのもの (BrokenBarrierError) は後ろに回す
+        errors.sort(key=lambda e: e[0])
+        raise RuntimeError('worker failed:\n' + errors[0][1])
+    return results
@@ -0,0 +1,189 @@
+import weakref
+import numpy as np
+from dezero.core_simple import Variable
+from dezero.core_simple import as_array
+from dezero.core_simple import using_config
+from dezero.core_simple import no_grad
+
+
+# =============================================================================
+# 高階微分: Hessian-vector product / ニュートン法
+# =============================================================================
+def _vdot(a, b):
+    return sum(float(np.sum(ai * bi)) for ai, bi in zip(a, b))
+
+
+class HessianVectorProduct:
+    def __init__(self, f, *xs):
+        self.xs = [Variable(as_array(x.data if isinstance(x, Variable) else x)) for x in xs]
+        self.y = f(*self.xs)
+        # 勾配の計算グラフを一度だけ作り，vを変えて何度も逆伝播する
+        self.y.backward(create_graph=True)
+        self.grads = [x.grad for x in self.xs]
+        for x in self.xs:
+            x.cleargrad()
+
+    def gradient(self):
+        gs = []
+        for x, g in zip(self.xs, self.grads):
+            if g is None:
+                gs.append(np.zeros_like(x.data))
+            elif isinstance(g, Variable):
+                gs.append(g.data)
+            else:
+                gs.append(g)
+        return gs
+
+    def __call__(self, *vs):
+        for x in self.xs:
+            x.cleargrad()
+
+        # H v = Σ_i (∂g_i/∂x)^T v_i なので，各g_iにv_iを種として逆伝播して足し合わせる
+        for g, v in zip(self.grads, vs):
+            if not isinstance(g, Variable) or g.creator is None:
+                continue
+            g.grad = np.asarray(v, dtype=g.dtype)
+            g.backward()
+
+        hvs = []
+        for x in self.xs:
+            hvs.append(np.zeros_like(x.data) if x.grad is None else x.grad)
+            x.cleargrad()
+        return hvs
+
+
+def hvp(f, xs, vs):
+    return HessianVectorProduct(f, *xs)(*vs)
+
+
+def newton_step(f, *xs, cg_iters=None, tol=1e-10):
+    hvp = HessianVectorProduct(f, *xs)
+    g = hvp.gradient()
+    if cg_iters is None:
+        cg_iters = sum(gi.size for gi in g)
+
+    # H p = -g を共役勾配法で解く (ヘッセ行列そのものは作らない)
+    p = [np.zeros_like(gi) for gi in g]
+    r = [-gi for gi in g]
+    d = [ri.copy() for ri in r]
+    rr = _vdot(r, r)
+    for i in range(cg_iters):
+        if rr <= tol ** 2:
+            break
+        hd = hvp(*d)
+        dhd = _vdot(d, hd)
+        if dhd <= 0:
+            # 負の曲率に当たったら打ち切る (最初の反復なら最急降下方向を使う)
+            if i == 0:
+                p = d
+            break
+        alpha = rr / dhd
+        p = [pi + alpha * di for pi, di in zip(p, d)]
+        r = [ri - alpha * hdi for ri, hdi in zip(r, hd)]
+        rr_new = _vdot(r, r)
+        d = [ri + (rr_new / rr) * di for ri, di in zip(r, d)]
+        rr = rr_new
+
+    for x, pi in zip(xs, p):
+        x.data += pi
+    return hvp.y
+
+
+# =============================================================================
+# ヤコビ行列 / サンプルごとの勾配: 種ベクトルをバッチ軸に並べて1回の逆伝播で求める
+# =============================================================================
+def _leaves(y):
+    leaves = []
+    funcs = [y.creator] if y.creator is not None else []
+    seen_set = set(funcs)
+    while funcs:
+        f = funcs.pop()
+        for x in f.inputs:
+            if x.creator is None:
+                leaves.append(x)
+            elif x.creator not in seen_set:
+                seen_set.add(x.creator)
+                funcs.append(x.creator)
+    return leaves
+
+
+def batch_backward(y, seeds, xs):
+    # seeds[b] を種としたときの xs の勾配を，先頭にバッチ軸を付けて返す
+    # (xs以外の葉の勾配もバッチ軸付きで計算されるので，元に戻しておく)
+    leaves = {id(x): x for x in _leaves(y) + list(xs)}
+    saved = {i: x.grad for i, x in leaves.items()}
+    for x in leaves.values():
+        x.cleargrad()
+    y.grad = seeds
+    with using_config('batch_grad', True):
+        y.backward()
+
+    grads = []
+    for x in xs:
+        gx = x.grad
+        if gx is None:
+            gx = np.zeros((len(seeds),) + x.shape, dtype=x.dtype)
+        elif gx.shape != (len(seeds),) + x.shape:
+            gx = np.broadcast_to(gx, (len(seeds),) + x.shape).copy()
+        grads.append(gx)
+    for i, x in leaves.items():
+        x.grad = saved[i]
+    return grads
+
+
+def jacobian(f, *xs):
+    # J[i] の形状は y.shape + xs[i].shape
+    xs = [Variable(as_array(x.data if isinstance(x, Variable) else x)) for x in xs]
+    y = f(*xs)
+    seeds = np.eye(y.size, dtype=y.dtype).reshape((y.size,) + y.shape)
+    grads = batch_backward(y, seeds, xs)
+    J = [g.reshape(y.shape + x.shape) for g, x in zip(grads, xs)]
+    return J[0] if len(J) == 1 else J
+
+
+def per_example_grad(losses, params):
+    # losses はサンプルごとの損失 (N,)．各パラメータについて (N,) + p.shape の勾配を返す
+    seeds = np.eye(losses.size, dtype=losses.dtype).reshape((losses.size,) + losses.shape)
+    return batch_backward(losses, seeds, params)
+
+
+# =============================================================================
+# forward mode: 接ベクトルを順伝播と同時に流す (計算グラフは作らない)
+# =============================================================================
+def jvp(f, xs, ts):
+    # (f(*xs), ∂f/∂x · t) を返す．出力が複数ならどちらもタプル
+    xs = [Variable(as_array(x.data if isinstance(x, Variable) else x)) for x in xs]
+    tangents = weakref.WeakKeyDictionary()
+    for x, t in zip(xs, ts):
+        tangents[x] = np.broadcast_to(np.asarray(t, dtype=x.dtype), x.shape)
+
+    with no_grad(), using_config('tangents', tangents):
+        ys = f(*xs)
+
+    multi_output = isinstance(ys, (tuple, list))
+    if not multi_output:
+        ys = (ys,)
+    tys = []
+    for y in ys:
+        ty = tangents.get(y) if isinstance(y, Variable) else None
+        if ty is None:
+            ty = np.zeros_like(y.data if isinstance(y, Variable) else y)
+        tys.append(as_array(ty))
+    if multi_output:
+        return tuple(ys), tuple(tys)
+    return ys[0], tys[0]
+
+
+def jacfwd(f, *xs):
+    # 入力の要素ごとにjvpを1回ずつ流してヤコビ行列を作る (入力が少なく出力が多いとき向け)
+    xs = [as_array(x.data if isinstance(x, Variable) else x) for x in xs]
+    J = []
+    for i, x in enumerate(xs):
+        cols = []
+        for k in range(x.size):
+            ts = [np.zeros_like(xj) for xj in xs]
+            ts[i].flat[k] = 1
+            y, ty = jvp(f, xs, ts)
+            cols.append(ty)
+        J.append(np.stack(cols, axis=-1).reshape(y.shape + x.shape))
+    return J[0] if len(J) == 1 else J
@@ -0,0 +1,438 @@
+import numpy as np
+from dezero import utils
+from dezero import backend
+from dezero.core_simple import Function
+from dezero.core_simple import Variable
+from dezero.core_simple import as_variable
+from dezero.core_simple import _operands
+from dezero.core_simple import _sum_to
+from dezero.core_simple import _nbatch
+from dezero.core_simple import _tsum
+from dezero.core_simple import _apply
+
+
+def _broadcast_to(gy, shape):
+    nbatch = _nbatch()
+    if nbatch and gy.ndim - nbatch < len(shape):
+        # バッチ軸の後ろに1を補って右寄せのブロードキャストで揃うようにする
+        pad = (1,) * (len(shape) - gy.ndim + nbatch)
+        gy = gy.reshape(gy.shape[:nbatch] + pad + gy.shape[nbatch:])
+    shape = gy.shape[:nbatch] + shape
+    if gy.shape == shape:
+        return gy
+    if isinstance(gy, Variable):
+        return broadcast_to(gy, shape)
+    xp = backend.get_array_module(gy)
+    return xp.broadcast_to(gy, shape)
+
+
+def _output(f, gy):
+    # 出力(weakref)をgyに合わせてVariableかndarrayで返す
+    y = f.outputs[0]()
+    return y if isinstance(gy, Variable) else y.data
+
+
+# =============================================================================
+# 基本的な関数: sin / cos / tanh / exp / log
+# =============================================================================
+class Sin(Function):
+    __slots__ = ()
+
+    def forward(self, x):
+        xp = backend.get_array_module(x)
+        y = xp.sin(x)
+        return y
+
+    def backward(self, gy):
+        x, = self.inputs
+        if isinstance(gy, Variable):
+            return gy * cos(x)
+        xp = backend.get_array_module(x)
+        return gy * xp.cos(x.data)
+
+    def jvp(self, xs, ts, ys):
+        xp = backend.get_array_module(xs[0])
+        return xp.cos(xs[0]) * ts[0]
+
+
+def sin(x):
+    return _apply(Sin, x)
+
+
+class Cos(Function):
+    __slots__ = ()
+
+    def forward(self, x):
+        xp = backend.get_array_module(x)
+        y = xp.cos(x)
+        return y
+
+    def backward(self, gy):
+        x, = self.inputs
+        if isinstance(gy, Variable):
+            return gy * -sin(x)
+        xp = backend.get_array_module(x)
+        return gy * -xp.sin(x.data)
+
+    def jvp(self, xs, ts, ys):
+        xp = backend.get_array_module(xs[0])
+        return -xp.sin(xs[0]) * ts[0]
+
+
+def cos(x):
+    return _apply(Cos, x)
+
+
+class Tanh(Function):
+    __slots__ = ()
+
+    def forward(self, x):
+        xp = backend.get_array_module(x)
+        y = xp.tanh(x)
+        return y
+
+    def backward(self, gy):
+        y = _output(self, gy)
+        gx = gy * (1 - y * y)
+        return gx
+
+    def jvp(self, xs, ts, ys):
+        y, = ys
+        return (1 - y * y) * ts[0]
+
+
+def tanh(x):
+    return _apply(Tanh, x)
+
+
+class Exp(Function):
+    __slots__ = ()
+
+    def forward(self, x):
+        xp = backend.get_array_module(x)
+        y = xp.exp(x)
+        return y
+
+    def backward(self, gy):
+        y = _output(self, gy)
+        gx = gy * y
+        return gx
+
+    def jvp(self, xs, ts, ys):
+        return ys[0] * ts[0]
+
+
+def exp(x):
+    return _apply(Exp, x)
+
+
+class Log(Function):
+    __slots__ = ()
+
+    def forward(self, x):
+        xp = backend.get_array_module(x)
+        y = xp.log(x)
+        return y
+
+    def backward(self, gy):
+        x, = _operands(self.inputs, gy)
+        gx = gy / x
+        return gx
+
+    def jvp(self, xs, ts, ys):
+        return ts[0] / xs[0]
+
+
+def log(x):
+    return _apply(Log, x)
+
+
+# =============================================================================
+# テンソルの形状: reshape / transpose
+# =============================================================================
+class Reshape(Function):
+    __slots__ = ('shape',)
+
+    def __init__(self, shape):
+        self.shape = shape
+
+    def forward(self, x):
+        y = x.reshape(self.shape)
+        return y
+
+    def backward(self, gy):
+        return gy.reshape(gy.shape[:_nbatch()] + self.inputs[0].shape)
+
+    def jvp(self, xs, ts, ys):
+        return ts[0].reshape(self.shape)
+
+
+def reshape(x, shape):
+    if x.shape == shape:
+        return as_variable(x)
+    return _apply(Reshape(shape), x)
+
+
+class Transpose(Function):
+    __slots__ = ('axes',)
+
+    def __init__(self, axes=None):
+        self.axes = axes
+
+    def forward(self, x):
+        y = x.transpose(self.axes)
+        return y
+
+    def backward(self, gy):
+        nbatch = _nbatch()
+        if self.axes is None:
+            if not nbatch:
+                return gy.transpose()
+            return gy.transpose((0,) + tuple(range(gy.ndim - 1, 0, -1)))
+
+        axes_len = len(self.axes)
+        inv_axes = tuple(np.argsort([ax % axes_len for ax in self.axes]))
+        if nbatch:
+            inv_axes = (0,) + tuple(ax + 1 for ax in inv_axes)
+        return gy.transpose(inv_axes)
+
+    def jvp(self, xs, ts, ys):
+        return ts[0].transpose(self.axes)
+
+
+def transpose(x, axes=None):
+    return _apply(Transpose(axes), x)
+
+
+# =============================================================================
+# テンソルの形状: sum_to / broadcast_to
+# =============================================================================
+class SumTo(Function):
+    __slots__ = ('shape',)
+
+    def __init__(self, shape):
+        self.shape = shape
+
+    def forward(self, x):
+        y = utils.sum_to(x, self.shape)
+        return y
+
+    def backward(self, gy):
+        x_shape = self.inputs[0].shape
+        return _broadcast_to(gy, x_shape)
+
+    def jvp(self, xs, ts, ys):
+        return utils.sum_to(ts[0], self.shape)
+
+
+def sum_to(x, shape):
+    if x.shape == shape:
+        return as_variable(x)
+    return _apply(SumTo(shape), x)
+
+
+class BroadcastTo(Function):
+    __slots__ = ('shape',)
+
+    def __init__(self, shape):
+        self.shape = shape
+
+    def forward(self, x):
+        xp = backend.get_array_module(x)
+        y = xp.broadcast_to(x, self.shape)
+        return y
+
+    def backward(self, gy):
+        return _sum_to(gy, self.inputs[0].shape)
+
+    def jvp(self, xs, ts, ys):
+        xp = backend.get_array_module(ts[0])
+        return xp.broadcast_to(ts[0], self.shape)
+
+
+def broadcast_to(x, shape):
+    if x.shape == shape:
+        return as_variable(x)
+    return _apply(BroadcastTo(shape), x)
+
+
+# =============================================================================
+# 和 / 行列積: sum / matmul / linear
+# =============================================================================
+class Sum(Function):
+    __slots__ = ('axis', 'keepdims')
+
+    def __init__(self, axis, keepdims):
+        self.axis = axis
+        self.keepdims = keepdims
+
+    def forward(self, x):
+        y = x.sum(axis=self.axis, keepdims=self.keepdims)
+        return y
+
+    def backward(self, gy):
+        x_shape = self.inputs[0].shape
+        gy = utils.reshape_sum_backward(gy, x_shape, self.axis, self.keepdims, _nbatch())
+        gx = _broadcast_to(gy, x_shape)
+        return gx
+
+    def jvp(self, xs, ts, ys):
+        return ts[0].sum(axis=self.axis, keepdims=self.keepdims)
+
+
+def sum(x, axis=None, keepdims=False):
+    return _apply(Sum(axis, keepdims), x)
+
+
+class MatMul(Function):
+    __slots__ = ()
+
+    def forward(self, x, W):
+        y = x.dot(W)
+        return y
+
+    def backward(self, gy):
+        x, W = _operands(self.inputs, gy)
+        gx = gy @ W.T
+        gW = x.T @ gy
+        return gx, gW
+
+    def jvp(self, xs, ts, ys):
+        x, W = xs
+        tx, tW = ts
+        return _tsum(None if tx is None else tx.dot(W), None if tW is None else x.dot(tW))
+
+
+def matmul(x, W):
+    return _apply(MatMul, x, W)
+
+
+class Linear(Function):
+    __slots__ = ()
+
+    def forward(self, x, W, b):
+        y = x.dot(W)
+        if b is not None:
+            y += b
+        return y
+
+    def backward(self, gy):
+        x, W, b = self.inputs
+        gb = None if b.data is None else _sum_to(gy, b.shape)
+        x, W = _operands((x, W), gy)
+        gx = gy @ W.T
+        gW = x.T @ gy
+        return gx, gW, gb
+
+    def jvp(self, xs, ts, ys):
+        x, W, b = xs
+        tx, tW, tb = ts
+        return _tsum(None if tx is None else tx.dot(W), None if tW is None else x.dot(tW), tb)
+
+
+def linear(x, W, b=None):
+    return _apply(Linear, x, W, b)
+
+
+# =============================================================================
+# 活性化関数 / 損失関数: sigmoid / softmax / softmax_cross_entropy
+# =============================================================================
+class Sigmoid(Function):
+    __slots__ = ()
+
+    def forward(self, x):
+        xp = backend.get_array_module(x)
+        y = xp.tanh(x * 0.5) * 0.5 + 0.5  # expのオーバーフローを避ける
+        return y
+
+    def backward(self, gy):
+        y = _output(self, gy)
+        gx = gy * y * (1 - y)
+        return gx
+
+    def jvp(self, xs, ts, ys):
+        y, = ys
+        return y * (1 - y) * ts[0]
+
+
+def sigmoid(x):
+    return _apply(Sigmoid, x)
+
+
+class Softmax(Function):
+    __slots__ = ('axis',)
+
+    def __init__(self, axis=1):
+        self.axis = axis
+
+    def forward(self, x):
+        xp = backend.get_array_module(x)
+        y = x - x.max(axis=self.axis, keepdims=True)
+        y = xp.exp(y)
+        y /= y.sum(axis=self.axis, keepdims=True)
+        return y
+
+    def backward(self, gy):
+        y = _output(self, gy)
+        gx = y * gy
+        axis = self.axis + _nbatch() if self.axis >= 0 else self.axis
+        sumdx = gx.sum(axis=axis, keepdims=True)
+        gx = gx - y * sumdx
+        return gx
+
+    def jvp(self, xs, ts, ys):
+        y, = ys
+        ty = y * ts[0]
+        return ty - y * ty.sum(axis=self.axis, keepdims=True)
+
+
+def softmax(x, axis=1):
+    return _apply(Softmax(axis), x)
+
+
+class SoftmaxCrossEntropy(Function):
+    __slots__ = ()
+
+    def forward(self, x, t):
+        xp = backend.get_array_module(x)
+        N = x.shape[0]
+        log_z = utils.logsumexp(x, axis=1)
+        log_p = x - log_z
+        log_p = log_p[xp.arange(N), t.ravel()]
+        y = -log_p.sum() / x.dtype.type(N)
+        return y
+
+    def backward(self, gy):
+        # softmaxとcross entropyをまとめて微分すると (softmax(x) - t) / N になる
+        x, t = self.inputs
+        xp = backend.get_array_module(x)
+        N, CLS_NUM = x.shape
+        t_onehot = xp.eye(CLS_NUM, dtype=x.dtype)[t.data.ravel()]
+        if isinstance(gy, Variable):
+            y = softmax(x)
+        else:
+            y = x.data - x.data.max(axis=1, keepdims=True)
+            xp.exp(y, out=y)
+            y /= y.sum(axis=1, keepdims=True)
+        gy = gy / N
+        if _nbatch():
+            gy = gy.reshape(gy.shape + (1, 1))
+        gx = (y - t_onehot) * gy
+        return gx
+
+    def jvp(self, xs, ts, ys):
+        x, t = xs
+        tx = ts[0]
+        if tx is None:
+            return None
+        xp = backend.get_array_module(x)
+        N, CLS_NUM = x.shape
+        y = x - x.max(axis=1, keepdims=True)
+        xp.exp(y, out=y)
+        y /= y.sum(axis=1, keepdims=True)
+        y -= xp.eye(CLS_NUM, dtype=x.dtype)[t.ravel()]
+        return (y * tx).sum() / x.dtype.type(N)
+
+
+def softmax_cross_entropy(x, t):
+    return _apply(SoftmaxCrossEntropy, x, t)
@@ -0,0 +1,213 @@
+import weakref
+import numpy as np
+from dezero.core_simple import Config
+from dezero.core_simple import Function
+from dezero.core_simple import Add, Sub, Mul, Div, Neg, Pow
+from dezero.functions import Sin, Cos
+
+
+# =============================================================================
+# 要素ごとの演算カーネル (出力先 out を指定して中間配列を作らない)
+# =============================================================================
+def _forward_kernel(f, a, out):
+    t = type(f)
+    if t is Add:
+        return np.add(a[0], a[1], out=out)
+    if t is Sub:
+        return np.subtract(a[0], a[1], out=out)
+    if t is Mul:
+        return np.multiply(a[0], a[1], out=out)
+    if t is Div:
+        return np.divide(a[0], a[1], out=out)
+    if t is Neg:
+        return np.negative(a[0], out=out)
+    if t is Pow:
+        return np.power(a[0], f.c, out=out)
+    if t is Sin:
+        return np.sin(a[0], out=out)
+    return np.cos(a[0], out=out)
+
+
+def _grad_kernel(f, j, a, y, gy, out):
+    # j番目の入力に流れる勾配を out に書き込む (outがNoneなら新しく確保する)
+    t = type(f)
+    if t is Add or (t is Sub and j == 0):
+        return np.positive(gy, out=out)
+    if t is Sub or t is Neg:
+        return np.negative(gy, out=out)
+    if t is Mul:
+        return np.multiply(gy, a[1 - j], out=out)
+    if t is Div:
+        out = np.divide(gy, a[1], out=out)
+        if j == 1:
+            np.multiply(out, y, out=out)
+            np.negative(out, out=out)
+        return out
+    if t is Pow:
+        out = np.power(a[0], f.c - 1, out=out)
+        np.multiply(out, f.c, out=out)
+    elif t is Sin:
+        out = np.cos(a[0], out=out)
+    else:
+        out = np.sin(a[0], out=out)
+        np.negative(out, out=out)
+    np.multiply(out, gy, out=out)
+    return out
+
+
+FUSIBLE = (Add, Sub, Mul, Div, Neg, Pow, Sin, Cos)
+
+
+class _Values(list):
+    # weakref.finalize を付けるための list
+    __slots__ = ('__weakref__',)
+
+
+class FusedElementwise(Function):
+    __slots__ = ('ops', 'args', 'need', 'n_inputs', 'shape', 'dtype', 'pool', 'grads', 'tmp',
+                 'xs', 'values')
+
+    def __init__(self, ops, args, need, n_inputs, shape, dtype):
+        # args[k] は k番目の演算の入力: 0以上は融合内の演算結果，負(~i)は外部入力i
+        self.ops = ops
+        self.args = args
+        self.need = need
+        self.n_inputs = n_inputs
+        # 形状はtrace時に確定しているので，中間結果と勾配のバッファを確保しておく
+        self.shape = shape
+        self.dtype = dtype
+        self.pool = [[np.empty(shape, dtype=dtype) for _ in ops[:-1]]]
+        self.grads = [np.empty(shape, dtype=dtype) for _ in ops]
+        self.tmp = np.empty(shape, dtype=dtype)
+        self.xs = None
+        self.values = None
+
+    def forward(self, *xs):
+        # 中間結果のバッファは呼び出しごとに持つ (前の呼び出しの逆伝播がまだ使うかもしれない)
+        # その呼び出しの中間結果が要らなくなったら，バッファを pool に戻して使い回す
+        if self.pool:
+            buffers = self.pool.pop()
+        else:
+            buffers = [np.empty(self.shape, dtype=self.dtype) for _ in self.ops[:-1]]
+        values = _Values(buffers + [None])
+        weakref.finalize(values, self.pool.append, buffers)
+        self.xs = xs
+        self.values = values
+        last = len(self.ops) - 1
+        for k, (f, args) in enumerate(zip(self.ops, self.args)):
+            a = [xs[~r] if r < 0 else values[r] for r in args]
+            # 出力は外に渡すので毎回新しく確保する
+            out = values[k] if k < last else None
+            values[k] = _forward_kernel(f, a, out)
+        return values[last]
+
+    def get_state(self):
+        return self.xs, self.values
+
+    def set_state(self, state):
+        self.xs, self.values = state
+
+    def backward(self, gy):
+        if Config.batch_grad:
+            raise NotImplementedError('batched backward is not supported for fused functions')
+        xs = self.xs
+        values = self.values
+        grads = [None] * len(self.ops)
+        grads[-1] = gy
+        gxs = [None] * self.n_inputs
+
+        for k in range(len(self.ops) - 1, -1, -1):
+            g = grads[k]
+            if g is None:
+                continue
+            f, args = self.ops[k], self.args[k]
+            a = [xs[~r] if r < 0 else values[r] for r in args]
+            for j, r in enumerate(args):
+                if not self.need[k][j]:
+                    continue
+                if r >= 0:
+                    # 融合内の中間結果は使われるのが1回だけなので，足し込みは不要
+                    grads[r] = _grad_kernel(f, j, a, values[k], g, self.grads[r])
+                elif gxs[~r] is None:
+                    gxs[~r] = _grad_kernel(f, j, a, values[k], g, np.empty_like(self.tmp))
+                else:
+                    np.add(gxs[~r], _grad_kernel(f, j, a, values[k], g, self.tmp), out=gxs[~r])
+        return tuple(gxs)
+
+
+# =============================================================================
+# 融合パス: trace の命令列から要素ごとの演算の木を見つけて1つの命令にまとめる
+# =============================================================================
+def fuse(instructions, variables, needs_grad, output_slots):
+    uses = {}
+    for _, in_slots, _ in instructions:
+        for i in in_slots:
+            uses[i] = uses.get(i, 0) + 1
+    for i in output_slots:
+        uses[i] = uses.get(i, 0) + 1
+
+    def fusible(f, in_slots, out_slots):
+        if not isinstance(f, FUSIBLE) or len(out_slots) != 1:
+            return False
+        y = variables[out_slots[0]].data
+        # カーネルはNumPyのufuncで書いているので，NumPy以外の配列は融合しない
+        if type(y) is not np.ndarray or \
+                any(type(variables[i].data) is not np.ndarray for i in in_slots):
+            return False
+        # 勾配が必要な入力はブロードキャストしないものに限る (定数はブロードキャストしてよい)
+        return all(variables[i].data.shape == y.shape for i in in_slots if i in needs_grad)
+
+    emitted = []
+    root_group = {}  # 出力スロット -> その出力を根とする融合グループ
+    for n, (f, in_slots, out_slots) in enumerate(instructions):
+        if not fusible(f, in_slots, out_slots):
+            emitted.append([(n, f, in_slots, out_slots)])
+            continue
+
+        y = variables[out_slots[0]].data
+        group = [(n, f, in_slots, out_slots)]
+        for i in in_slots:
+            g = root_group.pop(i, None)
+            if g is None:
+                continue
+            x = variables[i].data
+            if uses[i] == 1 and x.shape == y.shape and x.dtype == y.dtype:
+                group = g + group
+                g.clear()  # emitted からは取り除く
+        root_group[out_slots[0]] = group
+        emitted.append(group)
+
+    fused = []
+    for group in emitted:
+        if len(group) == 1:
+            _, f, in_slots, out_slots = group[0]
+            fused.append((f, in_slots, out_slots))
+        elif group:
+            fused.append(_build(sorted(group, key=lambda m: m[0]), variables, needs_grad))
+    return fused
+
+
+def _build(group, variables, needs_grad):
+    node_of = {}
+    external = []
+    ops, args, need = [], [], []
+    for k, (_, f, in_slots, out_slots) in enumerate(group):
+        refs, flags = [], []
+        for i in in_slots:
+            if i in node_of:
+                refs.append(node_of[i])
+                flags.append(any(need[node_of[i]]))
+            else:
+                if i not in external:
+                    external.append(i)
+                refs.append(~external.index(i))
+                flags.append(i in needs_grad)
+        node_of[out_slots[0]] = k
+        ops.append(f)
+        args.append(tuple(refs))
+        need.append(tuple(flags))
+
+    root = group[-1][3][0]
+    y = variables[root].data
+    fused = FusedElementwise(ops, args, need, len(external), y.shape, y.dtype)
+    return fused, tuple(external), (root,)
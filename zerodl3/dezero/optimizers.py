@@ -0,0 +1,202 @@
+import math
+from dezero import backend
+from dezero.core_simple import Variable
+
+
+# =============================================================================
+# Optimizer (基底クラス)
+# パラメータをdtypeごとに1本の連続したバッファにまとめ，更新を1回の演算で済ませる
+# =============================================================================
+class _Group:
+    def __init__(self, params, xp):
+        self.params = params
+        self.xp = xp
+        self.shapes = [p.data.shape for p in params]
+        sizes = [p.data.size for p in params]
+        self.offsets = [0]
+        for size in sizes:
+            self.offsets.append(self.offsets[-1] + size)
+
+        dtype = params[0].data.dtype
+        self.data = xp.empty(self.offsets[-1], dtype=dtype)
+        self.grad = xp.zeros(self.offsets[-1], dtype=dtype)
+        self.state = {}
+        # p.data を連続バッファのビューに差し替える (以降の p.data -= ... もそのまま使える)
+        self.views = []
+        for p, i, j, shape in zip(params, self.offsets, self.offsets[1:], self.shapes):
+            self.data[i:j] = p.data.ravel()
+            view = self.data[i:j].reshape(shape)
+            p.data = view
+            self.views.append(view)
+
+    def segments(self):
+        return zip(self.offsets, self.offsets[1:])
+
+    def gather(self):
+        # 各パラメータの勾配を連続バッファに集める．勾配がないパラメータの位置を返す
+        missing = []
+        for k, (p, view, (i, j)) in enumerate(zip(self.params, self.views, self.segments())):
+            if p.data is not view:
+                # p.data が差し替えられていたらバッファ側に取り込み直す
+                self.data[i:j] = p.data.ravel()
+                p.data = view
+            g = p.grad
+            if g is None:
+                self.grad[i:j] = 0
+                missing.append(k)
+                continue
+            if isinstance(g, Variable):
+                g = g.data
+            self.grad[i:j] = g.ravel()
+        return missing
+
+
+class Optimizer:
+    state_names = ()
+
+    def __init__(self):
+        self.target = None
+        self.groups = []
+        self.hooks = []
+
+    def setup(self, target):
+        # target は Variable の列 (またはparams()を持つオブジェクト)
+        if hasattr(target, 'params'):
+            target = target.params()
+        self.target = list(target)
+
+        by_dtype = {}
+        for p in self.target:
+            xp = backend.get_array_module(p.data)
+            by_dtype.setdefault((p.data.dtype, xp), []).append(p)
+        self.groups = [_Group(params, xp) for (_, xp), params in by_dtype.items()]
+        for g in self.groups:
+            for name in self.state_names:
+                g.state[name] = g.xp.zeros_like(g.data)
+        return self
+
+    def update(self):
+        active = []
+        for g in self.groups:
+            missing = g.gather()
+            if len(missing) < len(g.params):
+                active.append((g, missing))
+
+        # hook は dtype のグループごとに (data, grad) で呼ぶ．all_groups = True のものは全グループをまとめて渡す
+        for f in self.hooks:
+            if getattr(f, 'all_groups', False):
+                f([g.data for g, _ in active], [g.grad for g, _ in active])
+                continue
+            for g, _ in active:
+                f(g.data, g.grad)
+
+        for g, missing in active:
+            state = [g.state[name] for name in self.state_names]
+            if not missing:
+                self.update_one(g.data, g.grad, *state)
+                continue
+            # 勾配がないパラメータは更新しない (本と同じ振る舞い)
+            skip = set(missing)
+            for k, (i, j) in enumerate(g.segments()):
+                if k not in skip:
+                    self.update_one(g.data[i:j], g.grad[i:j], *[s[i:j] for s in state])
+
+    def update_one(self, data, grad, *state):
+        raise NotImplementedError()
+
+    def add_hook(self, f):
+        self.hooks.append(f)
+
+
+# =============================================================================
+# Hook: 勾配の連続バッファを直接書き換える
+# =============================================================================
+class WeightDecay:
+    def __init__(self, rate):
+        self.rate = rate
+
+    def __call__(self, data, grad):
+        grad += self.rate * data
+
+
+class ClipGrad:
+    # ノルムは全パラメータの勾配で求める (dtype が混ざっていても1つのノルム)
+    all_groups = True
+
+    def __init__(self, max_norm):
+        self.max_norm = max_norm
+
+    def __call__(self, datas, grads):
+        total_norm = math.sqrt(sum(float((grad * grad).sum()) for grad in grads))
+        rate = self.max_norm / (total_norm + 1e-6)
+        if rate < 1:
+            for grad in grads:
+                grad *= rate
+
+
+# =============================================================================
+# SGD / MomentumSGD / AdaGrad / Adam
+# =============================================================================
+class SGD(Optimizer):
+    def __init__(self, lr=0.01):
+        super().__init__()
+        self.lr = lr
+
+    def update_one(self, data, grad):
+        data -= self.lr * grad
+
+
+class MomentumSGD(Optimizer):
+    state_names = ('v',)
+
+    def __init__(self, lr=0.01, momentum=0.9):
+        super().__init__()
+        self.lr = lr
+        self.momentum = momentum
+
+    def update_one(self, data, grad, v):
+        v *= self.momentum
+        v -= self.lr * grad
+        data += v
+
+
+class AdaGrad(Optimizer):
+    state_names = ('h',)
+
+    def __init__(self, lr=0.001, eps=1e-8):
+        super().__init__()
+        self.lr = lr
+        self.eps = eps
+
+    def update_one(self, data, grad, h):
+        xp = backend.get_array_module(data)
+        h += grad * grad
+        data -= self.lr * grad / (xp.sqrt(h) + self.eps)
+
+
+class Adam(Optimizer):
+    state_names = ('m', 'v')
+
+    def __init__(self, alpha=0.001, beta1=0.9, beta2=0.999, eps=1e-8):
+        super().__init__()
+        self.t = 0
+        self.alpha = alpha
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.eps = eps
+
+    def update(self):
+        self.t += 1
+        super().update()
+
+    @property
+    def lr(self):
+        fix1 = 1. - math.pow(self.beta1, self.t)
+        fix2 = 1. - math.pow(self.beta2, self.t)
+        return self.alpha * math.sqrt(fix2) / fix1
+
+    def update_one(self, data, grad, m, v):
+        xp = backend.get_array_module(data)
+        m += (1 - self.beta1) * (grad - m)
+        v += (1 - self.beta2) * (grad * grad - v)
+        data -= self.lr * m / (xp.sqrt(v) + self.eps)
@@ -0,0 +1,79 @@
+import contextlib
+import json
+import time
+import weakref
+import numpy as np
+from dezero.core_simple import using_config
+
+
+# =============================================================================
+# profiler: Functionごとの時間・呼び出し回数・確保したメモリを記録する
+# =============================================================================
+class Profiler:
+    def __init__(self):
+        self.stats = {}   # Function名 -> [forward回数, forward時間, backward回数, backward時間, 出力bytes, 勾配bytes]
+        self.events = []  # Chrome trace のイベント
+        self.live_bytes = 0
+        self.peak_bytes = 0
+        self._live = {}   # id(配列) -> bytes (まだ解放されていない配列)
+        self._origin = time.perf_counter()
+
+    def record(self, f, phase, start, arrays):
+        end = time.perf_counter()
+        name = type(f).__name__
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = [0, 0.0, 0, 0.0, 0, 0]
+        nbytes = self._track(arrays)
+        k = 0 if phase == 'forward' else 2
+        stat[k] += 1
+        stat[k + 1] += end - start
+        stat[4 if phase == 'forward' else 5] += nbytes
+
+        self.events.append({'name': name, 'cat': phase, 'ph': 'X', 'pid': 0, 'tid': 0,
+                            'ts': (start - self._origin) * 1e6, 'dur': (end - start) * 1e6,
+                            'args': {'bytes': nbytes}})
+        if nbytes:
+            self.events.append({'name': 'live bytes', 'ph': 'C', 'pid': 0, 'tid': 0,
+                                'ts': (end - self._origin) * 1e6, 'args': {'bytes': self.live_bytes}})
+
+    def _track(self, arrays):
+        # 新しく確保された配列(ビューやスカラーは除く)を数え，解放されたら live_bytes から引く
+        nbytes = 0
+        for a in arrays:
+            if not isinstance(a, np.ndarray) or not a.flags.owndata or id(a) in self._live:
+                continue
+            nbytes += a.nbytes
+            self._live[id(a)] = a.nbytes
+            weakref.finalize(a, self._release, id(a))
+        self.live_bytes += nbytes
+        self.peak_bytes = max(self.peak_bytes, self.live_bytes)
+        return nbytes
+
+    def _release(self, key):
+        self.live_bytes -= self._live.pop(key, 0)
+
+    def table(self, sort_by='total'):
+        columns = {'total': lambda s: s[1] + s[3], 'forward': lambda s: s[1],
+                   'backward': lambda s: s[3], 'calls': lambda s: s[0] + s[2],
+                   'bytes': lambda s: s[4] + s[5]}
+        key = columns[sort_by]
+        lines = ['{:20s} {:>8s} {:>10s} {:>8s} {:>10s} {:>10s} {:>10s}'.format(
+            'Function', 'fwd', 'fwd ms', 'bwd', 'bwd ms', 'out MiB', 'grad MiB')]
+        for name, s in sorted(self.stats.items(), key=lambda item: key(item[1]), reverse=True):
+            lines.append('{:20s} {:8d} {:10.3f} {:8d} {:10.3f} {:10.2f} {:10.2f}'.format(
+                name, s[0], s[1] * 1e3, s[2], s[3] * 1e3, s[4] / 2 ** 20, s[5] / 2 ** 20))
+        lines.append('peak live tensor bytes: {:.2f} MiB'.format(self.peak_bytes / 2 ** 20))
+        return '\n'.join(lines)
+
+    def export_chrome_trace(self, path):
+        # chrome://tracing や Perfetto で開ける
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events}, f)
+
+
+@contextlib.contextmanager
+def profiler():
+    prof = Profiler()
+    with using_config('profiler', prof):
+        yield prof
@@ -0,0 +1,114 @@
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dezero.core_simple import Variable
+
+
+# =============================================================================
+# パラメータの保存と読み込み
+# 形式: マジック(8bytes) + ヘッダ長(8bytes) + JSONヘッダ + 64bytes境界に揃えた生の配列データ
+# 読み込みは np.memmap なので，ファイルの大きさによらずすぐ終わり，ページは複数プロセスで共有される
+# =============================================================================
+_MAGIC = b'DEZEROP1'
+_ALIGN = 64
+# バックグラウンド保存用 (ワーカーは1本なので，保存は呼ばれた順に行われる)
+_writer = ThreadPoolExecutor(max_workers=1)
+
+
+def _align(n):
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def _named(params):
+    # params は {名前: Variable}，Variable の列，または params() を持つオブジェクト
+    if hasattr(params, 'params'):
+        params = params.params()
+    items = params.items() if isinstance(params, dict) else enumerate(params)
+    return {str(name): p for name, p in items}
+
+
+def _create_temp(path):
+    # path と同じディレクトリに，他の保存と重ならない名前で作る (権限は open() と同じく umask に従う)
+    flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0)
+    while True:
+        tmp = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        try:
+            return os.open(tmp, flags, 0o666), tmp
+        except FileExistsError:
+            continue
+
+
+def _write(arrays, path):
+    entries = []
+    offset = 0
+    for name, a in arrays.items():
+        entries.append({'name': name, 'dtype': a.dtype.str, 'shape': list(a.shape),
+                        'offset': offset})
+        offset = _align(offset + a.nbytes)
+    header = json.dumps(entries).encode('utf-8')
+    start = _align(len(_MAGIC) + 8 + len(header))
+
+    # 書き込み途中のファイルを読まれないように，同じディレクトリの一時ファイルに書いてから置き換える
+    fd, tmp = _create_temp(path)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(len(header).to_bytes(8, 'little'))
+            f.write(header)
+            for entry, a in zip(entries, arrays.values()):
+                f.seek(start + entry['offset'])
+                f.write(np.ascontiguousarray(a).data)
+            f.truncate(start + offset)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def save_parameters(params, path, background=False):
+    arrays = {name: p.data if isinstance(p, Variable) else p
+              for name, p in _named(params).items()}
+    if not background:
+        _write(arrays, path)
+        return None
+    # 学習を止めないように，その時点の値をコピーして別スレッドで書き込む
+    # 戻り値は Future (result() で終了を待つ．書き込みに失敗していたらその例外が送出される)
+    snapshot = {name: np.array(a, copy=True) for name, a in arrays.items()}
+    return _writer.submit(_write, snapshot, path)
+
+
+def load_parameters(path, params=None, mode='c'):
+    # mode='c' は書き込むとそのプロセスだけのコピーになる (ファイルは変わらない)
+    with open(path, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError('{} is not a dezero parameter file'.format(path))
+        n = int.from_bytes(f.read(8), 'little')
+        entries = json.loads(f.read(n).decode('utf-8'))
+    start = _align(len(_MAGIC) + 8 + n)
+
+    arrays = {}
+    if entries:
+        buf = np.memmap(path, dtype=np.uint8, mode=mode)
+        for entry in entries:
+            dtype = np.dtype(entry['dtype'])
+            size = int(np.prod(entry['shape'])) * dtype.itemsize
+            i = start + entry['offset']
+            arrays[entry['name']] = buf[i:i + size].view(dtype).reshape(entry['shape'])
+
+    if params is not None:
+        # 全部確かめてから差し替える (途中で失敗したときに一部だけ読み込まれないように)
+        named = _named(params)
+        for name, p in named.items():
+            if name not in arrays:
+                raise KeyError('parameter {!r} is not in {}'.format(name, path))
+            a = arrays[name]
+            if a.shape != p.data.shape:
+                raise ValueError('shape mismatch for {!r}: {} != {}'.format(name, a.shape, p.data.shape))
+            if a.dtype != p.data.dtype:
+                raise ValueError('dtype mismatch for {!r}: {} != {}'.format(name, a.dtype, p.data.dtype))
+        for name, p in named.items():
+            p.data = arrays[name]
+    return arrays
+
@@ -0,0 +1,226 @@
+import sys
+from dezero.core_simple import Config
+from dezero.core_simple import Function
+from dezero.core_simple import Variable
+from dezero.core_simple import as_array
+from dezero.core_simple import as_variable
+from dezero.core_simple import no_grad
+from dezero.core_simple import using_config
+from dezero import fusion
+from dezero import backend
+
+
+# =============================================================================
+# trace: 計算グラフを一度だけ作り，以降は命令列を再生する
+# =============================================================================
+class Replay(Function):
+    __slots__ = ('traced', 'snapshot')
+
+    def __init__(self, traced):
+        self.traced = traced
+        self.snapshot = None
+
+    def forward(self, *xs):
+        # スロットの配列は次の再生で上書きされるので，この呼び出しの分を持っておく
+        ys, self.snapshot = self.traced._forward(xs)
+        return ys
+
+    def backward(self, *gys):
+        if any(isinstance(gy, Variable) for gy in gys):
+            raise NotImplementedError('create_graph is not supported for traced functions')
+        return self.traced._backward(gys, self.snapshot)
+
+    def jvp(self, xs, ts, ys):
+        # 命令列には接ベクトルの計算がないので，元の関数をeagerに実行して接ベクトルを流す
+        # クロージャで読むパラメータ (入力の後ろ) は元の Variable のまま使われるので，接ベクトルもそのまま効く
+        tangents = Config.tangents
+        vs = [Variable(x) for x in xs[:len(self.traced.input_slots)]]
+        for v, t in zip(vs, ts):
+            if t is not None:
+                tangents[v] = t
+        with no_grad():
+            outs = self.traced.fn(*vs)
+        if not self.traced.multi_output:
+            outs = (outs,)
+        return tuple(tangents.get(y) if isinstance(y, Variable) else None for y in outs)
+
+
+class TracedFunction:
+    def __init__(self, fn, fuse=False):
+        self.fn = fn
+        self.fuse = fuse
+        self.signature = None
+        self.variables = None     # スロット番号 -> Variable
+        self.instructions = None  # (forward, 入力スロット, 出力スロット) の列
+        self.backward_instructions = None
+        self.input_slots = None
+        self.param_slots = None   # クロージャなどで読んでいる，creator のない Variable
+        self.params = None
+        self.restore_slots = None
+        self.output_slots = None
+        self.fused = None         # 呼び出しごとの中間結果を持つ融合命令
+        self.multi_output = False
+
+    def __call__(self, *inputs):
+        inputs = [as_variable(as_array(x)) for x in inputs]
+        signature = tuple((x.shape, x.dtype) for x in inputs)
+
+        if self.signature is None:
+            self._capture(inputs)
+            self.signature = signature
+        elif signature != self.signature:
+            # 形状が変わったらeagerに戻る
+            return self.fn(*inputs)
+
+        outputs = Replay(self)(*inputs, *self.params)
+        if self.multi_output and not isinstance(outputs, list):
+            outputs = [outputs]
+        return tuple(outputs) if self.multi_output else outputs
+
+    def _capture(self, inputs):
+        placeholders = [Variable(x.data) for x in inputs]
+        with using_config('enable_backprop', True):
+            outputs = self.fn(*placeholders)
+        self.multi_output = isinstance(outputs, (tuple, list))
+        if not self.multi_output:
+            outputs = (outputs,)
+        outputs = [as_variable(as_array(y)) for y in outputs]
+
+        placeholder_ids = {id(x) for x in placeholders}
+        funcs = []
+        seen_set = set()
+        stack = [y.creator for y in outputs if y.creator is not None]
+        while stack:
+            f = stack.pop()
+            if f in seen_set:
+                continue
+            seen_set.add(f)
+            funcs.append(f)
+            for x in f.inputs:
+                if x.creator is not None and id(x) not in placeholder_ids:
+                    stack.append(x.creator)
+        # generationは入力側ほど小さいので，昇順に並べればトポロジカル順になる
+        funcs.sort(key=lambda f: f.generation)
+
+        # 入力以外で creator のない Variable (クロージャで読むパラメータなど) も Replay の入力にして，
+        # eager と同じように勾配が届くようにする．値は呼び出しのたびに Variable から読む
+        # ただし計算グラフからしか参照されていない定数 (x * 2.0 の 2.0 など) は勾配を読む人がいないので除く
+        uses = {}
+        for f in funcs:
+            for x in f.inputs:
+                if x.creator is None and id(x) not in placeholder_ids:
+                    uses[id(x)] = uses.get(id(x), 0) + 1
+        params = []
+        for f in funcs:
+            for x in f.inputs:
+                n = uses.pop(id(x), None)
+                # 参照は f.inputs (n 個) と変数 x と getrefcount の引数
+                if n is not None and sys.getrefcount(x) > n + 2:
+                    params.append(x)
+
+        variables = list(placeholders) + params
+        slot_of = {id(x): i for i, x in enumerate(variables)}
+
+        def slot(v):
+            if id(v) not in slot_of:
+                slot_of[id(v)] = len(variables)
+                variables.append(v)
+            return slot_of[id(v)]
+
+        needs_grad = set(range(len(variables)))  # 入力とパラメータ
+        instructions = []
+        for f in funcs:
+            in_slots = tuple(slot(x) for x in f.inputs)
+            out_slots = tuple(slot(y()) for y in f.outputs)
+            if any(i in needs_grad for i in in_slots):
+                needs_grad.update(out_slots)
+            instructions.append((f, in_slots, out_slots))
+        output_slots = tuple(slot(y) for y in outputs)
+        if self.fuse:
+            instructions = fusion.fuse(instructions, variables, needs_grad, output_slots)
+
+        # 命令ごとの属性参照や判定は再生のたびに行わないよう前もって解決しておく
+        self.variables = variables
+        self.instructions = [(f.forward, in_slots, out_slots)
+                             for f, in_slots, out_slots in instructions]
+        self.backward_instructions = [
+            (f.backward,
+             tuple(i if i in needs_grad else None for i in in_slots),
+             out_slots)
+            for f, in_slots, out_slots in reversed(instructions)
+            if any(i in needs_grad for i in out_slots)]
+        self.input_slots = tuple(range(len(placeholders)))
+        self.param_slots = tuple(range(len(placeholders), len(placeholders) + len(params)))
+        self.params = params
+        # パラメータは逆伝播の時点の値を使う (eager と同じ) ので，スナップショットから戻さない
+        self.restore_slots = tuple(i for i in range(len(variables)) if i not in self.param_slots)
+        self.output_slots = output_slots
+        self.fused = [f for f, _, _ in instructions if isinstance(f, fusion.FusedElementwise)]
+
+    def _forward(self, xs):
+        variables = self.variables
+        for i, x in zip(self.input_slots, xs):
+            variables[i].data = x
+
+        for forward, in_slots, out_slots in self.instructions:
+            ys = forward(*[variables[i].data for i in in_slots])
+            if len(out_slots) == 1:
+                ys = (ys,)
+            for i, y in zip(out_slots, ys):
+                variables[i].data = as_array(y)
+
+        snapshot = ([variables[i].data for i in self.restore_slots], [f.get_state() for f in self.fused])
+        return tuple(variables[i].data for i in self.output_slots), snapshot
+
+    def _backward(self, gys, snapshot):
+        # 捕捉した命令はスロットの Variable を参照しているので，この呼び出しの値に戻してから逆伝播する
+        variables = self.variables
+        datas, states = snapshot
+        for i, data in zip(self.restore_slots, datas):
+            variables[i].data = data
+        for f, state in zip(self.fused, states):
+            f.set_state(state)
+
+        grads = [None] * len(variables)
+        for i, gy in zip(self.output_slots, gys):
+            if gy is not None:
+                grads[i] = gy if grads[i] is None else grads[i] + gy
+
+        for backward, in_slots, out_slots in self.backward_instructions:
+            if len(out_slots) == 1:
+                gy = grads[out_slots[0]]
+                if gy is None:
+                    continue
+                gxs = backward(gy)
+            else:
+                gys = [grads[i] for i in out_slots]
+                if all(gy is None for gy in gys):
+                    continue
+                gys = [_zeros_like(variables[i].data) if gy is None else gy
+                       for i, gy in zip(out_slots, gys)]
+                gxs = backward(*gys)
+            if not isinstance(gxs, tuple):
+                gxs = (gxs,)
+
+            for i, gx in zip(in_slots, gxs):
+                if i is None or gx is None:
+                    continue
+                g = grads[i]
+                grads[i] = gx if g is None else g + gx
+
+        gxs = []
+        for i in self.input_slots + self.param_slots:
+            gx = grads[i]
+            if gx is None:
+                gx = _zeros_like(variables[i].data)
+            gxs.append(gx)
+        return tuple(gxs)
+
+
+def _zeros_like(x):
+    xp = backend.get_array_module(x)
+    return xp.zeros_like(x)
+
+
+def trace(fn, fuse=False):
+    return TracedFunction(fn, fuse)
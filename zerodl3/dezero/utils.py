@@ -1,5 +1,16 @@
+import io
+import json
+import multiprocessing
 import os
 import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from dezero import backend
+from dezero.core_simple import Variable
+from dezero.core_simple import no_grad
 
 def _dot_var(v, verbose=False):
     dot_var = '{} [label="{}", color=orange, style=filled]\n'
@@ -11,9 +22,13 @@ def _dot_var(v, verbose=False):
         name += str(v.shape) + ' ' + str(v.dtype)
     return dot_var.format(id(v), name)
 
-def _dot_func(f):
+def _dot_func_node(f, n=1):
     dot_func = '{} [label="{}", color=lightblue, style=filled, shape=box]\n'
-    txt = dot_func.format(id(f), f.__class__.__name__)
+    name = f.__class__.__name__
+    return dot_func.format(id(f), name if n == 1 else '{} x{}'.format(name, n))
+
+def _dot_func(f):
+    txt = _dot_func_node(f)
 
     dot_edge = '{} -> {}\n'
     for x in f.inputs:
@@ -22,8 +37,16 @@ def _dot_func(f):
         txt += dot_edge.format(id(f), id(y()))
     return txt
 
-def get_dot_graph(output, verbose=True):
-    txt = ''
+def get_dot_graph(output, verbose=True, collapse=False):
+    f = io.StringIO()
+    write_dot_graph(output, f, verbose, collapse)
+    return f.getvalue()
+
+
+# =============================================================================
+# 計算グラフの書き出し: ファイルに1パスで書き出す (変数ノードは重複させない)
+# =============================================================================
+def _walk(output):
     funcs = []
     seen_set = set()
 
@@ -32,25 +55,385 @@ def get_dot_graph(output, verbose=True):
             funcs.append(f)
             seen_set.add(f)
 
-    add_func(output.creator)
-    txt += _dot_var(output, verbose)
+    if output.creator is not None:
+        add_func(output.creator)
     while funcs:
         func = funcs.pop()
-        txt += _dot_func(func)
+        yield func
         for x in func.inputs:
-            txt += _dot_var(x, verbose)
             if x.creator is not None:
                 add_func(x.creator)
-    return 'digraph g {\n' + txt + '}'
 
-def plot_dot_graph(output, verbose=True, to_file='graph.png'):
-    dot_graph = get_dot_graph(output, verbose)
+
+def _collapse(output, max_period=8):
+    # 同じ形の部分グラフが鎖状に繰り返す部分を，最初の1回分のノードにまとめる
+    # (ループの y = y + x や，MatMul -> Tanh を100層重ねたものなど)
+    # 鎖: 出力が1つで，それを使う関数が1つだけのときに次の関数へつなぐ
+    # 鎖に沿った関数の並び(種類と入力の形状)から周期 k (max_period以下) で繰り返す区間を探す
+    funcs = sorted(_walk(output), key=lambda f: f.generation)
+    consumers = {}
+    for f in funcs:
+        for x in f.inputs:
+            consumers.setdefault(id(x), []).append(f)
+
+    next_of, has_prev = {}, set()
+    for f in funcs:
+        for x in f.inputs:
+            p = x.creator
+            if p is not None and len(p.outputs) == 1 and \
+                    p not in next_of and consumers[id(x)] == [f]:
+                next_of[p] = f
+                has_prev.add(f)
+                break
+
+    def signature(f):
+        return type(f), tuple(x.shape for x in f.inputs)
+
+    head, count, hidden = {f: f for f in funcs}, {}, set()
+    for start in funcs:
+        if start in has_prev:
+            continue
+        chain = [start]
+        while chain[-1] in next_of:
+            chain.append(next_of[chain[-1]])
+        sigs = [signature(f) for f in chain]
+
+        i, n = 0, len(chain)
+        while i < n:
+            best_k, best_r = 0, 0
+            for k in range(1, min(max_period, (n - i) // 2) + 1):
+                block = sigs[i:i + k]
+                r = 1
+                while i + (r + 1) * k <= n and sigs[i + r * k:i + (r + 1) * k] == block:
+                    r += 1
+                if r > 1 and r * k > best_k * best_r:
+                    best_k, best_r = k, r
+            if best_r < 2:
+                i += 1
+                continue
+
+            k, r = best_k, best_r
+            reps = chain[i:i + k]
+            for f in reps:
+                count[f] = r
+            for j in range(k, r * k):
+                f = chain[i + j]
+                head[f] = reps[j % k]
+                for x in f.inputs:
+                    # 繰り返しごとのパラメータ(葉)は最初の1回分で代表させる
+                    if x.creator is None and all(head[c] is not c for c in consumers[id(x)]):
+                        hidden.add(id(x))
+            # 区間の最後の出力以外の，鎖の間の変数は描かない
+            for j in range(k - 1, r * k - 1):
+                hidden.add(id(chain[i + j].outputs[0]()))
+            i += r * k
+    return funcs, head, count, hidden
+
+
+def _graph_items(output, collapse=False):
+    # ('var', v) / ('func', f, まとめた数) / ('edge', 元, 先) を順に返す
+    if collapse:
+        funcs, head, count, hidden = _collapse(output)
+    else:
+        funcs, head, count, hidden = _walk(output), None, None, ()
+
+    seen_vars = {id(output)}
+    seen_edges = set()  # まとめたノードへの同じ辺は1本にする
+    yield 'var', output
+    for f in funcs:
+        h = f if head is None else head[f]
+        if h is f:
+            yield 'func', f, 1 if count is None else count.get(f, 1)
+        for x in f.inputs:
+            if id(x) in hidden:
+                continue
+            if id(x) not in seen_vars:
+                seen_vars.add(id(x))
+                yield 'var', x
+            if h is not f or count is not None and count.get(f, 1) > 1:
+                if (id(x), id(h)) in seen_edges:
+                    continue
+                seen_edges.add((id(x), id(h)))
+            yield 'edge', x, h
+        for y in f.outputs:
+            y = y()
+            if y is None or id(y) in hidden:
+                continue
+            if id(y) not in seen_vars:
+                seen_vars.add(id(y))
+                yield 'var', y
+            yield 'edge', h, y
+
+
+def write_dot_graph(output, f, verbose=True, collapse=False):
+    f.write('digraph g {\n')
+    for item in _graph_items(output, collapse):
+        if item[0] == 'var':
+            f.write(_dot_var(item[1], verbose))
+        elif item[0] == 'func':
+            _, func, n = item
+            f.write(_dot_func_node(func, n))
+        else:
+            f.write('{} -> {}\n'.format(id(item[1]), id(item[2])))
+    f.write('}')
+
+
+def write_json_graph(output, f, collapse=False):
+    # {"nodes": [[番号, "var", 名前, 形状, dtype] / [番号, "func", 関数名, まとめた数]], "edges": [[元, 先]]}
+    ids = {}
+    edges = []
+    f.write('{"nodes":[')
+    sep = ''
+    for item in _graph_items(output, collapse):
+        if item[0] == 'edge':
+            edges.append('[{},{}]'.format(ids[id(item[1])], ids[id(item[2])]))
+            continue
+        i = ids[id(item[1])] = len(ids)
+        if item[0] == 'func':
+            f.write('{}[{},"func","{}",{}]'.format(sep, i, item[1].__class__.__name__, item[2]))
+        else:
+            v = item[1]
+            name = 'null' if v.name is None else json.dumps(v.name)
+            if v.data is None:
+                f.write('{}[{},"var",{},null,null]'.format(sep, i, name))
+            else:
+                shape = ','.join(map(str, v.shape))
+                f.write('{}[{},"var",{},[{}],"{}"]'.format(sep, i, name, shape, v.dtype))
+        sep = ','
+    f.write('],"edges":[')
+    f.write(','.join(edges))
+    f.write(']}')
+
+
+def plot_dot_graph(output, verbose=True, to_file='graph.png', collapse=False, background=False):
     tmp_dir = os.path.join(os.path.expanduser('~'), '.dezero')
     if not os.path.exists(tmp_dir):
         os.mkdir(tmp_dir)
-    graph_path = os.path.join(tmp_dir, 'tmp_graph.dot')
+    if background:
+        # 描画中に次のグラフで上書きされないように，ファイル名を分ける
+        fd, graph_path = tempfile.mkstemp(suffix='.dot', dir=tmp_dir)
+        os.close(fd)
+    else:
+        graph_path = os.path.join(tmp_dir, 'tmp_graph.dot')
     with open(graph_path, 'w') as f:
-        f.write(dot_graph)
+        write_dot_graph(output, f, verbose, collapse)
+
     extension = os.path.splitext(to_file)[1][1:]
-    cmd = 'dot {} -T {} -o {}'.format(graph_path, extension, to_file)
-    subprocess.run(cmd, shell=True)
+    cmd = ['dot', graph_path, '-T', extension, '-o', to_file]
+    if background:
+        # 学習を止めずに描画する (終わったかどうかは戻り値の Popen で確認できる)
+        # 一時ファイルは dot が終わったら消す
+        try:
+            proc = subprocess.Popen(cmd)
+        except BaseException:
+            os.remove(graph_path)
+            raise
+        threading.Thread(target=_remove_when_done, args=(proc, graph_path), daemon=True).start()
+        return proc
+    subprocess.run(cmd)
+
+
+def _remove_when_done(proc, path):
+    proc.wait()
+    os.remove(path)
+
+
+# =============================================================================
+# 配列の形状操作
+# =============================================================================
+def sum_to(x, shape, nbatch=0):
+    # xの要素を足し合わせてshapeの形状にする (ブロードキャストの逆)
+    # 先頭のnbatch個の軸(種ごとのバッチ軸)はそのまま残す
+    ndim = len(shape)
+    lead = x.ndim - nbatch - ndim
+    lead_axis = tuple(range(nbatch, nbatch + lead))
+
+    axis = tuple([i + nbatch + lead for i, sx in enumerate(shape) if sx == 1])
+    y = x.sum(lead_axis + axis, keepdims=True)
+    if lead > 0:
+        y = y.squeeze(lead_axis)
+    return y
+
+
+def reshape_sum_backward(gy, x_shape, axis, keepdims, nbatch=0):
+    # sumで潰した軸を復活させ，勾配をブロードキャストできる形にする
+    ndim = len(x_shape)
+    tupled_axis = axis
+    if axis is None:
+        tupled_axis = None
+    elif not isinstance(axis, tuple):
+        tupled_axis = (axis,)
+
+    if not (ndim == 0 or tupled_axis is None or keepdims):
+        actual_axis = [a if a >= 0 else a + ndim for a in tupled_axis]
+        shape = list(gy.shape)
+        for a in sorted(actual_axis):
+            shape.insert(a + nbatch, 1)
+    elif nbatch and tupled_axis is None and not keepdims:
+        shape = gy.shape[:nbatch] + (1,) * ndim
+    else:
+        shape = gy.shape
+
+    gy = gy.reshape(shape)
+    return gy
+
+
+def logsumexp(x, axis=1):
+    xp = backend.get_array_module(x)
+    m = x.max(axis=axis, keepdims=True)
+    y = x - m
+    xp.exp(y, out=y)
+    s = y.sum(axis=axis, keepdims=True)
+    xp.log(s, out=s)
+    m += s
+    return m
+
+
+# =============================================================================
+# 勾配確認: 中心差分を，ずらした入力をバッチ軸に並べてまとめて計算する
+# =============================================================================
+def _perturb(x, idx, eps):
+    # 先頭k個は idx の要素に +eps，残りk個は -eps した x を並べる
+    k = len(idx)
+    X = np.repeat(x.reshape(1, -1), 2 * k, axis=0)
+    X[np.arange(k), idx] += eps
+    X[np.arange(k, 2 * k), idx] -= eps
+    return X.reshape((2 * k,) + x.shape)
+
+
+def _project(y, r):
+    # 出力を r で重み付けして足したスカラー
+    return float(np.vdot(y, r))
+
+
+def _evaluate(f, args):
+    y = f(*args)
+    return y.data if isinstance(y, Variable) else y
+
+
+def _central_diff(f, xs, i, idx, r, eps, mode):
+    # mode: 'batched' (ずらした入力をバッチ軸に並べる)，'array' (配列のまま1要素ずつ)，'variable' (Variableで1要素ずつ)
+    if mode == 'batched':
+        args = [Variable(x) for x in xs]
+        X = _perturb(xs[i], idx, eps)
+        args[i] = Variable(X)
+        with no_grad():
+            y = f(*args).data
+        if y.shape != X.shape[:1] + r.shape:
+            raise ValueError('f does not broadcast over the batch axis')
+        L = y.reshape(len(X), -1) @ r.ravel()
+        k = len(idx)
+        return (L[:k] - L[k:]) / (2 * eps)
+
+    # 1要素ずつずらして評価する (数値微分の素朴な実装と同じ)
+    # 'array' では配列のまま渡すので，各演算は no_grad の高速パス (_apply) を通る
+    x = xs[i].copy()
+    flat = x.reshape(-1)
+    if mode == 'array':
+        args = list(xs)
+        args[i] = x
+    else:
+        args = [Variable(x) for x in xs]
+        args[i] = Variable(x)
+    diff = np.empty(len(idx))
+    with no_grad():
+        for n, j in enumerate(idx):
+            tmp = flat[j]
+            flat[j] = tmp + eps
+            fxh1 = _project(_evaluate(f, args), r)
+            flat[j] = tmp - eps
+            fxh2 = _project(_evaluate(f, args), r)
+            flat[j] = tmp
+            diff[n] = (fxh1 - fxh2) / (2 * eps)
+    return diff
+
+
+def _select_mode(f, xs, i, idx, r, eps, modes):
+    # 最初の数要素を Variable で1要素ずつ計算したものを基準にして，他の方法で結果が一致すれば速い方を以降で使う
+    # (バッチ軸を足した入力で正しく評価できない関数，例えば軸を指定したsumなどはバッチにしない)
+    # 戻り値: 方法，先頭の要素の差分，1要素あたりの時間
+    start = time.perf_counter()
+    reference = _central_diff(f, xs, i, idx, r, eps, 'variable')
+    best = ('variable', reference, time.perf_counter() - start)
+    for mode in modes:
+        try:
+            start = time.perf_counter()
+            diff = _central_diff(f, xs, i, idx, r, eps, mode)
+            elapsed = time.perf_counter() - start
+        except (ValueError, IndexError, TypeError, AttributeError):
+            continue
+        if np.allclose(diff, reference) and elapsed < best[2]:
+            best = (mode, diff, elapsed)
+    mode, diff, elapsed = best
+    return mode, diff, elapsed / len(idx)
+
+
+_pool_task = None
+
+
+def _init_pool(task):
+    # fork したワーカーに f と入力を渡す (pickleしないので lambda でもよい)
+    global _pool_task
+    _pool_task = task
+
+
+def _pool_central_diff(idx):
+    f, xs, i, r, eps, mode = _pool_task
+    return _central_diff(f, xs, i, idx, r, eps, mode)
+
+
+def numerical_grad(f, xs, i, r, eps=1e-4, chunk=256, processes=None, batched=None,
+                   max_elements=2 ** 22, min_pool_time=0.5):
+    # batched: None なら速い方を選ぶ，True ならバッチ軸を足して，False なら1要素ずつ計算する
+    # processes: None なら，バッチにできず時間がかかりそうなとき (min_pool_time 秒以上) にCPUの数だけ使う
+    x = xs[i]
+    if x.size == 0:
+        return np.zeros_like(x)
+    start = 0
+    diffs = []
+    if batched:
+        mode = 'batched'
+    else:
+        start = min(8, x.size)
+        modes = ('array',) if batched is False else ('array', 'batched')
+        mode, diff, per_element = _select_mode(f, xs, i, np.arange(start), r, eps, modes)
+        diffs.append(diff)
+    if mode == 'batched':
+        # ずらした入力は 2*chunk*x.size 要素になるので大きな入力では chunk を小さくする
+        chunk = max(1, min(chunk, max_elements // (2 * x.size)))
+    chunks = [np.arange(s, min(s + chunk, x.size)) for s in range(start, x.size, chunk)]
+
+    if processes is None:
+        cpus = os.cpu_count() or 1
+        slow = mode != 'batched' and per_element * (x.size - start) >= min_pool_time
+        processes = min(cpus, len(chunks)) if slow and cpus > 1 else 1
+    if processes <= 1:
+        diffs += [_central_diff(f, xs, i, idx, r, eps, mode) for idx in chunks]
+    else:
+        ctx = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(processes, mp_context=ctx, initializer=_init_pool,
+                                 initargs=((f, xs, i, r, eps, mode),)) as executor:
+            diffs += executor.map(_pool_central_diff, chunks)
+    return np.concatenate(diffs).reshape(x.shape)
+
+
+def gradcheck(f, *inputs, eps=1e-4, chunk=256, processes=None, batched=None, seed=0):
+    # backwardの勾配と中心差分との差の最大値を入力ごとに返す (浮動小数点数でない入力はNone)
+    # float32 だと丸め誤差が大きくて差分が当てにならないので，浮動小数点数の入力は float64 で調べる
+    xs = [np.asarray(x.data if isinstance(x, Variable) else x) for x in inputs]
+    xs = [x.astype(np.float64) if x.dtype.kind == 'f' else x for x in xs]
+    vs = [Variable(x) for x in xs]
+    y = f(*vs)
+    r = np.random.default_rng(seed).standard_normal(y.shape).astype(y.dtype)
+    y.grad = r
+    y.backward()
+
+    errors = []
+    for i, (x, v) in enumerate(zip(xs, vs)):
+        if x.dtype.kind != 'f':
+            errors.append(None)
+            continue
+        num = numerical_grad(f, xs, i, r, eps, chunk, processes, batched)
+        grad = np.zeros_like(x) if v.grad is None else v.grad
+        errors.append(float(np.abs(num - grad).max()) if x.size else 0.0)
+    return errors
@@ -0,0 +1,35 @@
+#
+# ニュートン法を用いた最適化(自動計算)
+#
+
+# step29では2階微分を手計算していたが，
+# backward(create_graph=True)で逆伝播の計算グラフも作れば2階微分も自動で求まる
+
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+
+import numpy as np
+from dezero.core_simple import Variable
+
+
+def f(x):
+    return x**4 - 2*x**2
+
+x = Variable(np.array(2.0))
+iters = 10
+
+for i in range(iters):
+    print(i, x)
+
+    y = f(x)
+    x.cleargrad()
+    y.backward(create_graph=True)
+
+    gx = x.grad # create_graph=Trueなので勾配もVariable
+    x.cleargrad()
+    gx.backward()
+    gx2 = x.grad
+
+    x.data -= gx.data / gx2
@@ -0,0 +1,65 @@
+if '__file__' in globals():
+    import os, sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import numpy as np
+import pytest
+import dezero
+import dezero.functions as F
+from dezero import Variable
+
+
+def eager_grads(f, x, params):
+    for p in params:
+        p.cleargrad()
+    f(Variable(x)).backward()
+    return [p.grad.copy() for p in params]
+
+
+@pytest.mark.parametrize('fuse', [False, True])
+def test_closure_parameters_get_gradients(fuse):
+    # クロージャで読んだパラメータにも eager と同じ勾配が入る (更新した値も次の呼び出しで使われる)
+    rng = np.random.default_rng(0)
+    W = Variable(rng.standard_normal((3, 4)))
+    b = Variable(np.zeros(4))
+
+    def f(x):
+        return F.sum(F.tanh(F.matmul(x, W) + b) * 2.0)
+
+    traced = dezero.trace(f, fuse=fuse)
+    for _ in range(3):
+        x = rng.standard_normal((5, 3))
+        expected = eager_grads(f, x, [W, b])
+        W.cleargrad()
+        b.cleargrad()
+        traced(x).backward()
+        for p, g in zip([W, b], expected):
+            assert p.grad is not None
+            assert np.allclose(p.grad, g)
+        W.data = W.data - 0.1 * W.grad
+
+
+@pytest.mark.parametrize('fuse', [False, True])
+def test_two_calls_before_backward(fuse):
+    # 2回目の再生でスロットが上書きされても，1回目の出力からの逆伝播は1回目の値を使う
+    rng = np.random.default_rng(1)
+    W = Variable(rng.standard_normal((3, 4)))
+
+    def f(x):
+        return F.sum(F.tanh(F.matmul(x, W))) + F.sum(F.sin(x) * x)
+
+    x1, x2 = rng.standard_normal((5, 3)), rng.standard_normal((5, 3))
+    expected1 = eager_grads(f, x1, [W])[0]
+    expected2 = eager_grads(f, x2, [W])[0]
+
+    traced = dezero.trace(f, fuse=fuse)
+    traced(x1)  # 計算グラフを作る
+    v1, v2 = Variable(x1), Variable(x2)
+    y1 = traced(v1)
+    y2 = traced(v2)
+    W.cleargrad()
+    y1.backward()
+    assert np.allclose(W.grad, expected1)
+    W.cleargrad()
+    y2.backward()
+    assert np.allclose(W.grad, expected2)
+    assert v1.grad is not None and not np.allclose(v1.grad, v2.grad)